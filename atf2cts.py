@@ -1,21 +1,23 @@
 #!/usr/bin/env python3
 
+import io
 import os
 import xml.etree.ElementTree as ET
-from xml.dom.minidom import parseString
 
 import atf2tei
 import cts
+import store
 import tei
 
 
-def segmentor(fp):
+def segmentor(fp, verbose=True):
     'Read a file object and segment it into atf records.'
     atf = None
     sync = False
     for line in fp.readlines():
         if line.startswith('&'):
-            print('New atf record:', line.strip())
+            if verbose:
+                print('New atf record:', line.strip())
             # Start of a new record. Flush the old one, if any.
             if atf and sync:
                 yield atf
@@ -30,45 +32,28 @@ def segmentor(fp):
         yield atf
 
 
-def convert(atf, data_path, textgroup=None):
-    '''Convert an atf string and write it out as XML.
-
-    data_path should be the path to the data directory inside
-    the target CTS file repository.
-
-    The URNs and file locations under data_path will be derived
-    from the textgroup, if one is passed in. If no textgroup is
-    supplied, a work-specific textgroup will be generated and
-    written out as well.
+def export(doc, textgroup=None):
+    '''Compose the CTS files for a converted document.
 
-    returns a (success, parse_failed, export_failed) flag tuple.'''
+    The URNs and file locations will be derived from the textgroup,
+    if one is passed in. If no textgroup is supplied, a work-specific
+    textgroup will be generated and included as well.
 
-    success = (True, False, False)
-    parse_failed = (False, True, False)
-    export_failed = (False, False, True)
+    returns a list of (path, urn, xml) tuples, with each path
+    relative to the data directory of the target CTS file
+    repository.'''
 
-    try:
-        doc = atf2tei.convert(atf)
-    except Exception as e:
-        print('Error converting ATF:', e)
-        print(atf)
-        return parse_failed
-    try:
-        _ = parseString(str(doc))
-    except Exception as e:
-        print('Error parsing converted XML:', e)
-        return export_failed
+    files = []
+    path = ''
 
     if not textgroup:
         'Generate a work-specific textgroup.'
         textgroup = cts.TextGroup()
         textgroup.urn = f'urn:cts:cdli:{doc.header.cdli_code}'
         textgroup.name = f'CDLI {doc.header.cdli_code} {doc.header.title}'
-        data_path = os.path.join(data_path, textgroup.urn.split(':')[-1])
-        os.makedirs(data_path, exist_ok=True)
-        print(f'Writing textgroup to {data_path}')
-        os.makedirs(data_path, exist_ok=True)
-        textgroup.write(os.path.join(data_path, '__cts__.xml'))
+        path = textgroup.urn.split(':')[-1]
+        files.append((os.path.join(path, '__cts__.xml'), textgroup.urn,
+                      str(textgroup)))
 
     # Compose work metadata under the given textgroup.
     urn = f'{textgroup.urn}.{doc.header.cdli_code}'
@@ -79,17 +64,14 @@ def convert(atf, data_path, textgroup=None):
     work.language = doc.language
     work.title = doc.header.title
 
-    work_path = os.path.join(data_path, urn.split('.')[-1])
-
-    print('Writing', urn, doc.language, 'to', work_path)
-    os.makedirs(work_path, exist_ok=True)
+    work_path = os.path.join(path, urn.split('.')[-1])
 
     # Add CTS refsDecl.
     encodingDesc = ET.Element('encodingDesc')
     encodingDesc.append(cts.RefsDecl().xml)
     doc.header.encodingDesc = encodingDesc
 
-    # Write out each part of the document parts separately
+    # Serialize each part of the document parts separately
     # (edition, translation, etc.) so they can be referenced
     # individually through the CTS refsDecl.
     parts = doc.parts
@@ -110,47 +92,255 @@ def convert(atf, data_path, textgroup=None):
         doc.parts = [part]
 
         doc_filename = part.name.split(':')[-1] + '.xml'
-        doc.write(os.path.join(work_path, doc_filename))
+        files.append((os.path.join(work_path, doc_filename), part.name,
+                      str(doc)))
 
         work.parts.append(part)
+    doc.parts = parts
+
+    # Add the metadata index file.
+    files.append((os.path.join(work_path, '__cts__.xml'), work.workUrn,
+                  str(work)))
+
+    return files
+
+
+def render(atf, textgroup=None, validate=False):
+    '''Convert an atf string to CTS files without writing them.
+
+    Arguments are as for convert. Returns a (success, parse_failed,
+    export_failed, errors, files) tuple, where files is a list of
+    (path, urn, xml) tuples as returned by export.'''
+
+    parse_failed = (False, True, False, [], [])
+    export_failed = (False, False, True, [], [])
+
+    from xml.dom.minidom import parseString
+
+    try:
+        doc = atf2tei.convert(atf)
+    except Exception as e:
+        print('Error converting ATF:', e)
+        print(atf)
+        return parse_failed
+    try:
+        _ = parseString(str(doc))
+    except Exception as e:
+        print('Error parsing converted XML:', e)
+        return export_failed
+
+    files = export(doc, textgroup)
+    errors = []
+    if validate:
+        import validate as epidoc
+        for path, _, xml in files:
+            # Only the TEI parts are Epidoc; skip the CTS metadata.
+            if os.path.basename(path) == '__cts__.xml':
+                continue
+            for line, message in epidoc.validate(xml):
+                print(f'Invalid Epidoc {path}:{line}: {message}')
+                errors.append(message)
+
+    return True, False, False, errors, files
+
+
+def convert(atf, data_path, textgroup=None, validate=False):
+    '''Convert an atf string and write it out as XML.
+
+    data_path should be the path to the data directory inside
+    the target CTS file repository.
+
+    The URNs and file locations under data_path will be derived
+    from the textgroup, if one is passed in. If no textgroup is
+    supplied, a work-specific textgroup will be generated and
+    written out as well.
+
+    returns a (success, parse_failed, export_failed) tuple of flags.
 
-    # Write out the metadata index file.
-    work.write(os.path.join(work_path, '__cts__.xml'))
+    If validate is true, each TEI part is checked against the
+    Epidoc schema before it is written, and a list of any schema
+    error messages is returned as a fourth element of the tuple.'''
 
-    return success
+    s, p, e, errors, files = render(atf, textgroup, validate)
+    if files:
+        work_path = os.path.join(data_path, os.path.dirname(files[-1][0]))
+        print('Writing', files[-1][1], 'to', work_path)
+        directory = store.DirectoryStore(data_path)
+        for path, urn, xml in files:
+            directory.write(path, urn, xml)
+
+    if validate:
+        return s, p, e, errors
+    return s, p, e
+
+
+def convert_all(atfs, task, workers, output=None, profile=None):
+    '''Run task on each atf record in a worker pool, tallying results.
+
+    task should return a tuple like render, or like convert if no
+    output store is given for the files. A record which repeatedly
+    kills its worker counts as a parse failure, and the remaining
+    records are still converted. Pass a profiling.Aggregate when
+    task is wrapped in profiling.run.
+
+    returns a (counts, schema_errors) tuple of Counters, with counts
+    of successful, parse_failed, export_failed and invalid records.'''
+    import collections
+
+    import pool
+
+    counts = collections.Counter()
+    schema_errors = collections.Counter()
+    for result in workers.imap_unordered(task, atfs, return_errors=True):
+        if isinstance(result, Exception):
+            code = None
+            if isinstance(result, pool.WorkerError):
+                code = atf2tei.record_code(result.item)
+            print(f'Error converting record {code}:', result)
+            counts['parse_failed'] += 1
+            continue
+        if profile:
+            result, stats = result
+            profile.add(stats)
+        s, p, e = result[:3]
+        errors = result[3] if len(result) > 3 else []
+        if output:
+            for path, urn, xml in result[4]:
+                output.write(path, urn, xml)
+        counts['successful'] += s
+        counts['parse_failed'] += p
+        counts['export_failed'] += e
+        counts['invalid'] += bool(errors)
+        schema_errors.update(errors)
+    return counts, schema_errors
 
 
 if __name__ == '__main__':
-    import io
-    import sys
+    import argparse
+    import functools
 
-    from concurrent import futures
     from datetime import datetime
 
+    import pool
+
+    parser = argparse.ArgumentParser(
+        description='Convert ATF files into a CTS file repository.')
+    parser.add_argument('filenames', metavar='FILE', nargs='*',
+                        help='ATF input file, or with --watch a '
+                             'directory of .atf files')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running, reconverting records as '
+                             'their input files change')
+    parser.add_argument('--interval', metavar='SECONDS', type=float,
+                        default=1.0,
+                        help='how often to check for changes with '
+                             '--watch (default %(default)s)')
+    parser.add_argument('--database', metavar='FILE',
+                        help='store output in an SQLite database instead '
+                             'of the data directory; export it later with '
+                             'store.py')
+    parser.add_argument('--validate', action='store_true',
+                        help='validate each document against the '
+                             'Epidoc schema (requires lxml)')
+    parser.add_argument('--processes', type=int,
+                        help='number of worker processes '
+                             '(default is the number of cores)')
+    parser.add_argument('--max-tasks-per-child', metavar='N', type=int,
+                        help='replace each worker after N records')
+    parser.add_argument('--max-rss', metavar='MB', type=int,
+                        help='replace a worker once its resident memory '
+                             'exceeds MB megabytes after a record')
+    parser.add_argument('--profile', metavar='PROFILE',
+                        help='profile each conversion and write merged '
+                             'pstats to PROFILE, with collapsed stacks '
+                             'for flame graphs in PROFILE.collapsed')
+    parser.add_argument('--profile-top', metavar='N', type=int, default=20,
+                        help='number of functions to report when '
+                             'profiling (default %(default)s)')
+    args = parser.parse_args()
+    if args.watch and args.profile:
+        parser.error('--profile cannot be used with --watch')
+
     start = datetime.utcnow()
-    successful = 0
-    parse_failures = 0
-    export_failures = 0
 
     # Relative path to place CTS file repository data.
     data_path = 'data'
 
-    for filename in sys.argv[1:]:
-        print('Parsing:', filename)
-        with io.open(filename, encoding='utf-8') as f:
-            with futures.ProcessPoolExecutor() as exe:
-                jobs = [exe.submit(convert, atf, data_path)
-                        for atf in segmentor(f)]
-                for job in futures.as_completed(jobs):
-                    s, p, e = job.result()
-                    successful += s
-                    parse_failures += p
-                    export_failures += e
+    max_rss = args.max_rss * 2**20 if args.max_rss else None
+
+    if args.watch:
+        import sys
+
+        import watch
+
+        # Write files from this process, replacing each file
+        # atomically so the repository stays readable.
+        if args.database:
+            output = store.SQLiteStore(args.database)
+        else:
+            output = store.DirectoryStore(data_path)
+        task = functools.partial(render, validate=args.validate)
+        with pool.Pool(args.processes, args.max_tasks_per_child,
+                       max_rss) as workers:
+            try:
+                watch.run(args.filenames, task, output, workers,
+                          args.interval)
+            except KeyboardInterrupt:
+                pass
+        output.close()
+        sys.exit()
+
+    if args.database:
+        # Write files from this process, since the database
+        # has a single writer.
+        output = store.SQLiteStore(args.database)
+        task = functools.partial(render, validate=args.validate)
+    else:
+        # Workers write their own files into the data directory.
+        output = None
+        task = functools.partial(convert, data_path=data_path,
+                                 validate=args.validate)
+
+    if args.profile:
+        import profiling
+        profile = profiling.Aggregate()
+        task = functools.partial(profiling.run, task)
+
+    def records():
+        'Generate the atf records in every input file.'
+        for filename in args.filenames:
+            print('Parsing:', filename)
+            with io.open(filename, encoding='utf-8') as f:
+                yield from segmentor(f)
+
+    with pool.Pool(args.processes, args.max_tasks_per_child,
+                   max_rss) as workers:
+        counts, schema_errors = convert_all(
+            records(), task, workers, output,
+            profile if args.profile else None)
+    successful = counts['successful']
+    parse_failures = counts['parse_failed']
+    export_failures = counts['export_failed']
+    invalid = counts['invalid']
+    if output:
+        output.close()
+        print('Wrote output to', args.database)
     if parse_failures:
         print('Error:', parse_failures, 'records did not convert.')
     if export_failures:
         print('Error:', export_failures, 'records did not serialize.')
+    if invalid:
+        print('Error:', invalid, 'records are not valid Epidoc.')
+        for message, count in schema_errors.most_common(10):
+            print(f'  {count:6d}  {message}')
+    workers.report()
     elapsed = datetime.utcnow() - start
     seconds = elapsed.seconds + elapsed.microseconds*1e-6
     print(f'Successfully converted {successful} records from ATF',
           f'in {seconds:0.3f} seconds.')
+    if args.profile:
+        profile.dump(args.profile)
+        profile.write_collapsed(args.profile + '.collapsed')
+        profile.report(args.profile_top)
+        print(f'Wrote profile data to {args.profile}',
+              f'and {args.profile}.collapsed')
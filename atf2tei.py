@@ -2,47 +2,149 @@
 
 # -*- coding: utf-8 -*-
 
+import collections
+import itertools
+import os
 import re
-from xml.sax.saxutils import escape
-
-from pyoracc.atf.common.atffile import AtfFile
-from pyoracc.model.line import Line
-from pyoracc.model.oraccobject import OraccObject
-from pyoracc.model.ruling import Ruling
-from pyoracc.model.state import State
-from pyoracc.model.translation import Translation
 
 import tei
 
 verbose = False
 
+# Pickled parser tables, which load much faster than the
+# tables module shipped with pyoracc.
+parsetab_cache = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '__pycache__', 'atf2tei.parsetab.pickle')
+
+# Lexer and parser shared by every conversion in this process.
+_lexer = None
+_parser = None
+
+
+def write_parsetab_cache(filename=parsetab_cache):
+    'Save pyoracc parser tables in the format read by ply.yacc.'
+    import pickle
+
+    from ply import yacc
+    from pyoracc.atf import parsetab
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tables = [
+        yacc.__tabversion__,
+        parsetab._lr_method,
+        parsetab._lr_signature,
+        parsetab._lr_action,
+        parsetab._lr_goto,
+        parsetab._lr_productions,
+    ]
+    # Write under a temporary name so concurrent workers
+    # never see a partial file.
+    partial = f'{filename}.{os.getpid()}'
+    with open(partial, 'wb') as f:
+        for table in tables:
+            pickle.dump(table, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(partial, filename)
+
+
+def parse(atf_text):
+    '''Parse an ATF string with pyoracc, returning the Text object.
+
+    The pyoracc AtfFile wrapper builds a new lexer and parser for
+    every record. Build them once instead, loading the parser
+    tables from a pickled cache.'''
+    global _lexer, _parser
+
+    if _parser is None:
+        from ply import lex, yacc
+        from pyoracc.atf.cdli.atflex import AtfCDLILexer
+        from pyoracc.atf.cdli.atfyacc import AtfCDLIParser
+
+        if not os.path.exists(parsetab_cache):
+            try:
+                write_parsetab_cache()
+            except OSError as e:
+                print('Could not cache parser tables:', e)
+        # Bypass AtfCDLIParser.__init__, which loads the slow tables.
+        grammar = AtfCDLIParser.__new__(AtfCDLIParser)
+        # ply regenerates and re-pickles the tables if they are
+        # missing or don't match the grammar.
+        _parser = yacc.yacc(module=grammar, picklefile=parsetab_cache,
+                            debug=False, errorlog=yacc.NullLogger())
+        _lexer = AtfCDLILexer(False, False, lex.NullLogger()).lexer
+
+    # Lex each record from a fresh copy of the initial lexer state.
+    lexer = _lexer.clone()
+    lexer.lexstatestack = []
+    if not atf_text.endswith('\n'):
+        atf_text += '\n'
+    return _parser.parse(atf_text, lexer=lexer)
+
 
 def convert(atf_text):
     """
     Create a TEI representation of a file-like object containing ATF.
     """
+    return build(events(atf_text))
+
+
+def build(events):
+    'Assemble a tei.Document from a sequence of conversion events.'
+    stack = []
+    for event, obj in events:
+        if event == 'start':
+            if stack:
+                stack[-1].append(obj)
+            stack.append(obj)
+        elif event == 'child':
+            stack[-1].append(obj)
+        elif event == 'end':
+            doc = stack.pop()
+    return doc
+
+
+def events(atf_text):
+    '''Convert ATF lazily, generating (event, object) pairs.
+
+    Events describe the TEI document as it is traversed:
+
+        ('start', obj)  a tei.Document or tei.TextPart opens,
+                        before any of its children are generated.
+        ('child', obj)  a tei.Line or tei.Note inside the open part.
+        ('end', obj)    the most recently opened object closes.
+
+    Consumers such as tei.EventWriter can serialize each line as
+    it is generated, without holding the whole document model.'''
+    from pyoracc.model.line import Line
+    from pyoracc.model.oraccobject import OraccObject
+    from pyoracc.model.ruling import Ruling
+    from pyoracc.model.state import State
+    from pyoracc.model.translation import Translation
 
     # Parse the ATF input string.
-    atf = AtfFile(atf_text, 'cdli', False)
+    atf = parse(atf_text)
     if verbose:
-        print("Parsed {} -- {}".format(atf.text.code, atf.text.description))
+        print("Parsed {} -- {}".format(atf.code, atf.description))
 
     # Construct a TEI Document to hold the converted text.
     doc = tei.Document()
-    doc.language = atf.text.language
+    doc.language = atf.language
     doc.header = tei.Header()
-    doc.header.title = atf.text.description
-    doc.header.cdli_code = atf.text.code
+    doc.header.title = atf.description
+    doc.header.cdli_code = atf.code
+    yield 'start', doc
 
     # Traverse the parse tree, recording lines under labels.
     translations = {}
-    objects = [item for item in atf.text.children
+    objects = [item for item in atf.children
                if isinstance(item, OraccObject)]
     edition = tei.Edition()
-    doc.parts.append(edition)
+    # Record the language on the edition itself so it survives
+    # conversion back to ATF.
+    edition.language = atf.language
+    yield 'start', edition
     for item in objects:
         part = tei.TextPart(item.objecttype)
-        edition.append(part)
+        yield 'start', part
         for section in item.children:
             if isinstance(section, OraccObject):
                 try:
@@ -50,7 +152,7 @@ def convert(atf_text):
                 except AttributeError:
                     name = section.objecttype
                 div = tei.TextPart(name)
-                part.append(div)
+                yield 'start', div
             elif isinstance(section, Translation):
                 # Handle in another pass.
                 continue
@@ -60,19 +162,19 @@ def convert(atf_text):
                 continue
             for obj in section.children:
                 if isinstance(obj, Line):
-                    text = normalize_transliteration(obj.words)
-                    line = tei.Line(obj.label, text)
-                    div.append(line)
+                    tokens = tokenize_transliteration(obj.words)
+                    line = tei.Line(obj.label, tokens)
+                    yield 'child', line
                     # Older pyoracc parses interlinear translatsions
                     # as notes. Remember them for serialization below.
                     for note in obj.notes:
                         if note.content.startswith('tr.'):
                             lang, text = note.content.split(':', maxsplit=1)
                             _, lang = lang.split('.')
-                            # tr.ts is used for normalization, so mark
-                            # this with the primary object's language.
-                            if lang == 'ts':
-                                lang == atf.text.language
+                            # tr.ts is used for normalization. It keeps
+                            # 'ts' as its language rather than taking the
+                            # primary object's, which would give it the
+                            # same CTS URN and file as the edition.
                             tr_line = Line(obj.label)
                             tr_line.words = text.strip().split()
                             if lang not in translations:
@@ -82,92 +184,243 @@ def convert(atf_text):
                     text = str(obj).strip()
                     # Strip the initial '$' off the ATF representation.
                     text = text[1:].strip()
-                    div.append(tei.Note(text))
+                    yield 'child', tei.Note(text)
                 else:
                     print('Skipping unknown section child type',
                           type(obj).__name__)
                     continue
+            yield 'end', div
+        yield 'end', part
+    yield 'end', edition
 
     # Add accumulated interlinear translations to the document.
     for lang, tr_lines in translations.items():
         translation = tei.Translation()
         translation.language = lang
-        doc.parts.append(translation)
+        yield 'start', translation
         for tr_line in tr_lines:
             text = ' '.join(tr_line.words)
-            line = tei.Line(tr_line.label, text)
-            translation.append(line)
+            yield 'child', tei.Line(tr_line.label, text)
+        yield 'end', translation
 
     # Traverse the tree again, recording any parallel translation sections.
-    # pyoracc only supports these for English.
-    translation = tei.Translation()
-    translation.language = 'eng'
-    translation_empty = True
-    for item in objects:
-        part = tei.TextPart(item.objecttype)
-        translation.append(part)
-        for section in item.children:
-            # Skip anything which is not a translation for this pass.
-            if not isinstance(section, Translation):
-                continue
-            for surface in section.children:
-                if isinstance(surface, OraccObject):
-                    div = tei.TextPart(surface.objecttype)
-                    part.append(div)
-                    for obj in surface.children:
-                        if isinstance(obj, Line):
-                            text = ' '.join(obj.words)
-                            line = tei.Line(obj.label, text)
-                            div.append(line)
-                            translation_empty = False
-                        else:
-                            print('Skipping unknown section child type',
-                                  {type(obj).__name__})
-                            continue
-    if not translation_empty:
-        doc.parts.append(translation)
+    # pyoracc only supports these for English. Check for any translated
+    # lines first, since an empty translation is left out.
+    translated = any(
+        isinstance(obj, Line)
+        for item in objects
+        for section in item.children if isinstance(section, Translation)
+        for surface in section.children if isinstance(surface, OraccObject)
+        for obj in surface.children
+    )
+    if translated:
+        translation = tei.Translation()
+        translation.language = 'eng'
+        yield 'start', translation
+        for item in objects:
+            part = tei.TextPart(item.objecttype)
+            yield 'start', part
+            for section in item.children:
+                # Skip anything which is not a translation for this pass.
+                if not isinstance(section, Translation):
+                    continue
+                for surface in section.children:
+                    if isinstance(surface, OraccObject):
+                        div = tei.TextPart(surface.objecttype)
+                        yield 'start', div
+                        for obj in surface.children:
+                            if isinstance(obj, Line):
+                                text = ' '.join(obj.words)
+                                yield 'child', tei.Line(obj.label, text)
+                            else:
+                                print('Skipping unknown section child type',
+                                      {type(obj).__name__})
+                                continue
+                        yield 'end', div
+            yield 'end', part
+        yield 'end', translation
 
-    return doc
+    yield 'end', doc
+
+
+def record_code(atf_text):
+    'Return the CDLI code from the &-line of an ATF record, if any.'
+    match = re.match(r'\s*&\s*(\S+)', atf_text)
+    if match:
+        return match.group(1)
+    return None
+
+
+def convert_record(atf_text):
+    '''Convert a single ATF record, capturing any failure.
+
+    Returns a (code, result) tuple where result is the converted
+    Document, or the exception raised while converting it.'''
+    try:
+        doc = convert(atf_text)
+    except Exception as e:
+        return record_code(atf_text), e
+    return doc.header.cdli_code, doc
+
+
+def convert_many(atf_texts, processes=None, ordered=True, window=None):
+    '''Convert an iterable of ATF record strings.
+
+    Generates a (code, result) tuple for each record as it finishes,
+    where result is either a tei.Document or the exception raised
+    while converting that record. Nothing is read from or written
+    to the filesystem.
+
+    By default records are converted one at a time in this process.
+    Pass the number of worker processes to convert them in parallel.
+    With ordered=False results are generated in order of completion
+    rather than input order. At most window records (by default
+    twice the number of processes) are read ahead of the consumer,
+    so a slow consumer bounds memory use.'''
+    if not processes:
+        for atf_text in atf_texts:
+            yield convert_record(atf_text)
+        return
+
+    from concurrent import futures
+
+    atf_texts = iter(atf_texts)
+    window = window or 2 * processes
+    pending = collections.deque()
+    with futures.ProcessPoolExecutor(processes) as exe:
+        def fill():
+            'Submit records until the window is full.'
+            count = window - len(pending)
+            for atf_text in itertools.islice(atf_texts, count):
+                pending.append(exe.submit(convert_record, atf_text))
+
+        try:
+            fill()
+            while pending:
+                if ordered:
+                    job = pending.popleft()
+                else:
+                    done, _ = futures.wait(
+                        pending, return_when=futures.FIRST_COMPLETED)
+                    job = done.pop()
+                    pending.remove(job)
+                result = job.result()
+                # Keep the workers busy while the consumer runs.
+                fill()
+                yield result
+        finally:
+            for job in pending:
+                job.cancel()
+
+
+# ATF digraphs for characters outside ASCII.
+# See http://oracc.org/doc/help/editinginatf/primer/inlinetutorial/
+digraphs = {
+    'sz': 'š',      # \u0161
+    'SZ': 'Š',      # \u0160
+    's,': 'ṣ',      # \u1E63
+    'S,': 'Ṣ',      # \u1E62
+    't,': 'ṭ',      # \u1E6D
+    'T,': 'Ṭ',      # \u1E6C
+    "s'": 'ś',      # \u015B
+    "S'": 'Ś',      # \u015A
+    'h,': 'ḫ',      # \u1E2B
+    'H,': 'Ḫ',      # \u1E2A
+    'j': 'ŋ',       # \u014B
+    'J': 'Ŋ',       # \u014A
+}
+_digraph_pattern = re.compile('|'.join(map(re.escape, digraphs)))
+
+# Alternatives for scanning a word into sign tokens, tried in order
+# at each position. The group names become the token kinds.
+_sign_pattern = re.compile(r'''
+      (?P<determinative>\{[^}]*\})
+    | (?P<numeral>\d+(?:/\d+)?(?:\([^)\s]*\))?)
+    | (?P<gap>\.\.\.)
+    | (?P<sign>[^\s\-.:+{}\[\]\#<>_]+)
+    | (?P<damage>\#)
+    | (?P<logogram_mark>_)
+    | (?P<break_open>\[)
+    | (?P<break_close>\])
+    | (?P<text>.)
+''', re.VERBOSE)
+
+# Token kinds which a damage flag applies to.
+_damageable = {'sign', 'logogram', 'determinative', 'numeral'}
+
+
+def tokenize_transliteration(words):
+    '''Convert a sequence of words from atf to a list of tei.Token.
+
+    The line is scanned once, splitting it into determinatives,
+    logograms, numerals and other signs, along with markers for
+    damage and breakage and the separators between signs.'''
+    tokens = []
+    append = tokens.append
+    Token = tei.Token
+    # Underscores mark runs of logograms, which may span words.
+    logographic = False
+    # Convert digraphs to corresponding unicode characters.
+    line = _digraph_pattern.sub(lambda m: digraphs[m[0]], ' '.join(words))
+    for match in _sign_pattern.finditer(line):
+        kind = match.lastgroup
+        text = match[0]
+        if kind == 'sign':
+            # Logograms are written in upper case or between underscores.
+            if logographic or text.isupper():
+                kind = 'logogram'
+        elif kind == 'logogram_mark':
+            logographic = not logographic
+            continue
+        elif kind == 'determinative':
+            text = text[1:-1]
+        elif kind == 'damage':
+            # Flag the preceding sign as damaged.
+            if tokens and tokens[-1].kind in _damageable:
+                tokens[-1] = tokens[-1]._replace(damaged=True)
+                continue
+            kind = 'text'
+        append(Token(kind, text))
+    return tokens
 
 
 def normalize_transliteration(words):
     'Convert a sequence of words from atf to standard formatting.'
-    # See http://oracc.org/doc/help/editinginatf/primer/inlinetutorial/
-    result = []
-    for word in words:
-        # Convert digraphs to corresponding unicode characters.
-        word = re.sub(r'sz', 'š', word)     # \u0161
-        word = re.sub(r'SZ', 'Š', word)     # \u0160
-        word = re.sub(r's,', 'ṣ', word)     # \u1E63
-        word = re.sub(r'S,', 'Ṣ', word)     # \u1E62
-        word = re.sub(r't,', 'ṭ', word)     # \u1E6D
-        word = re.sub(r'T,', 'Ṭ', word)     # \u1E6C
-        word = re.sub(r's\'', 'ś', word)    # \u015B
-        word = re.sub(r'S\'', 'Ś', word)    # \u015A
-        word = re.sub(r'h,', 'ḫ', word)     # \u1E2B
-        word = re.sub(r'H,', 'Ḫ', word)     # \u1E2A
-        word = re.sub(r'j', 'ŋ', word)      # \u014B
-        word = re.sub(r'J', 'Ŋ', word)      # \u014A
-        # Convert damage marks to half-brackets.
-        marked = [
-            '⸢' + sign[:-1] + '⸣' if sign.endswith('#')
-            else sign
-            for sign in word.split('-')
-        ]
-        word = '-'.join(marked)
-        # XML-escape the result.
-        word = escape(word)
-        # Convert markup to tei elements.
-        # TODO: <c type="determinative">
-        # TODO: <c type="sign" subtype="logo">
-        result.append(word)
-    return ' '.join(result)
+    tokens = tokenize_transliteration(words)
+    return ''.join(str(token) for token in tokens)
 
 
 if __name__ == '__main__':
+    import argparse
     import io
     import sys
-    for filename in sys.argv[1:]:
+
+    parser = argparse.ArgumentParser(
+        description='Convert ATF files to TEI XML.')
+    parser.add_argument('filenames', metavar='FILE', nargs='*',
+                        help='ATF input file')
+    parser.add_argument('--format', choices=['xml', 'ndjson'], default='xml',
+                        help='output format (default %(default)s)')
+    parser.add_argument('--records', choices=['line', 'document'],
+                        default='line',
+                        help='write an ndjson record per line or per '
+                             'document (default %(default)s)')
+    parser.add_argument('--lazy', action='store_true',
+                        help='write xml incrementally as it is converted, '
+                             'without building the whole document first')
+    args = parser.parse_args()
+
+    if args.format == 'ndjson':
+        import ndjson
+
+    for filename in args.filenames:
         with io.open(filename, encoding='utf-8') as f:
-            doc = convert(f.read())
-            print(doc)
+            if args.format == 'ndjson':
+                doc = convert(f.read())
+                ndjson.write(doc, sys.stdout, args.records)
+            elif args.lazy:
+                writer = tei.EventWriter(sys.stdout)
+                writer.write(events(f.read()))
+            else:
+                doc = convert(f.read())
+                print(doc)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+'''Benchmark transliteration normalization throughput.
+
+Generates a large synthetic corpus of ATF words mixing syllables,
+determinatives, logograms, numerals, damage and breakage, then
+times the sign tokenizer in atf2tei against the previous approach
+of applying one regular expression substitution per digraph.
+
+Usage: python bench/normalize.py [--words N] [--repeat N] [--seed N]
+'''
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import atf2tei  # noqa: E402
+import tei  # noqa: E402
+
+
+syllables = ['a', 'na', 'be', 'el', 'szu', 'nu', 'qi2', 'bi2', 'ma', 'um',
+             'di', 'sza', 'li', 'ba', 'al', 'it,', 'ka', 'ki', 'am', 'ta',
+             'asz', 'pu', 'ra', 'h,a', 's,a', 'ri', 'tu', 'lu', 'ip', 'ar']
+logograms = ['LUGAL', 'DUMU', 'MESZ', 'GAN2', 'KU3.BABBAR', 'SZE', 'E2']
+determinatives = ['{d}', '{ki}', '{gesz}', '{disz}', '{munus}']
+numerals = ['1(disz)', '2(u)', '3(asz)', '1(bur3)', '5', '1/2(disz)']
+
+
+def word(rng):
+    'Generate a random transliterated word.'
+    roll = rng.random()
+    if roll < 0.1:
+        text = rng.choice(numerals)
+    elif roll < 0.2:
+        text = rng.choice(logograms)
+    elif roll < 0.25:
+        signs = rng.sample(syllables, rng.randint(1, 3))
+        text = '_' + '-'.join(signs) + '_'
+    else:
+        signs = [rng.choice(syllables) for _ in range(rng.randint(1, 5))]
+        signs = [sign + '#' if rng.random() < 0.1 else sign
+                 for sign in signs]
+        text = '-'.join(signs)
+    if rng.random() < 0.1:
+        text = rng.choice(determinatives) + text
+    roll = rng.random()
+    if roll < 0.03:
+        text = '[...]'
+    elif roll < 0.08:
+        text = '[' + text + ']'
+    return text
+
+
+def legacy(words):
+    'The per-digraph substitution normalization this replaced.'
+    result = []
+    for word in words:
+        word = re.sub(r'sz', 'š', word)
+        word = re.sub(r'SZ', 'Š', word)
+        word = re.sub(r's,', 'ṣ', word)
+        word = re.sub(r'S,', 'Ṣ', word)
+        word = re.sub(r't,', 'ṭ', word)
+        word = re.sub(r'T,', 'Ṭ', word)
+        word = re.sub(r's\'', 'ś', word)
+        word = re.sub(r'S\'', 'Ś', word)
+        word = re.sub(r'h,', 'ḫ', word)
+        word = re.sub(r'H,', 'Ḫ', word)
+        word = re.sub(r'j', 'ŋ', word)
+        word = re.sub(r'J', 'Ŋ', word)
+        marked = [
+            '⸢' + sign[:-1] + '⸣' if sign.endswith('#')
+            else sign
+            for sign in word.split('-')
+        ]
+        word = '-'.join(marked)
+        word = word.replace('&', '&amp;')
+        word = word.replace('<', '&lt;').replace('>', '&gt;')
+        result.append(word)
+    return ' '.join(result)
+
+
+def serialize(words):
+    'Tokenize a line and build its XML element.'
+    return tei.Line('1', atf2tei.tokenize_transliteration(words)).xml
+
+
+def measure(func, lines, repeat):
+    'Return the best time over several passes of func over lines.'
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            func(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark transliteration normalization.')
+    parser.add_argument('--words', type=int, default=200000,
+                        help='corpus size in words (default %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='passes to take the best of '
+                             '(default %(default)s)')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='random seed (default %(default)s)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lines = []
+    count = 0
+    while count < args.words:
+        line = [word(rng) for _ in range(rng.randint(2, 8))]
+        lines.append(line)
+        count += len(line)
+    size = sum(len(w) + 1 for line in lines for w in line)
+    print(f'Corpus: {len(lines)} lines, {count} words, {size / 1e6:0.1f} MB')
+
+    for name, func in [
+        ('legacy substitutions', legacy),
+        ('tokenize', atf2tei.tokenize_transliteration),
+        ('tokenize + xml', serialize),
+    ]:
+        elapsed = measure(func, lines, args.repeat)
+        print(f'  {name:22} {elapsed:7.3f} s',
+              f'{count / elapsed / 1000:8.1f} k words/s',
+              f'{size / elapsed / 1e6:6.2f} MB/s')
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+'''Benchmark cold-start latency of the command line converters.
+
+Runs a one-record conversion in a fresh interpreter several times
+and reports wall-clock time, then runs it once more under
+`python -X importtime` and reports the slowest imports.
+
+Usage: python bench/startup.py [--runs N] [--top N] [script [args...]]
+'''
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+default_command = ['atf2tei.py', 'SIL-034.atf']
+
+
+def wall_times(command, runs):
+    'Return the wall-clock time of each of several cold runs.'
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + command, cwd=root, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def import_times(command):
+    '''Return (module, self, cumulative) import times in microseconds.
+
+    Only imports made directly by the converter, rather than
+    nested inside other imports, are reported.'''
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + command,
+                            cwd=root, check=True, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            # Column header.
+            continue
+        name = fields[2]
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), depth, own, cumulative))
+    # Interpreter startup imports are at depth zero, as are the
+    # direct imports of the __main__ module, so take the shallowest.
+    return [(name, own, cumulative)
+            for name, depth, own, cumulative in imports if depth == 0]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark converter startup time.')
+    parser.add_argument('--runs', type=int, default=10,
+                        help='number of cold runs (default %(default)s)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of imports to list (default %(default)s)')
+    parser.add_argument('command', nargs='*', default=default_command,
+                        help='script and arguments to run '
+                             '(default %(default)s)')
+    args = parser.parse_args()
+
+    # Run once untimed so any on-disk caches are populated.
+    wall_times(args.command, 1)
+
+    times = wall_times(args.command, args.runs)
+    print(f'{" ".join(args.command)}: {args.runs} cold runs')
+    print(f'  min    {min(times) * 1000:8.1f} ms')
+    print(f'  median {statistics.median(times) * 1000:8.1f} ms')
+    print(f'  max    {max(times) * 1000:8.1f} ms')
+
+    imports = import_times(args.command)
+    total = sum(cumulative for _, _, cumulative in imports)
+    print(f'Top-level imports: {total / 1000:0.1f} ms')
+    imports.sort(key=lambda item: item[2], reverse=True)
+    for name, own, cumulative in imports[:args.top]:
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
@@ -0,0 +1,72 @@
+'''Newline-delimited JSON export of converted TEI documents.
+
+Downstream consumers which only need the text of each line can
+read these records instead of re-parsing the generated XML.'''
+
+import json
+
+import tei
+
+
+def _walk(part, path):
+    'Generate (path, line) pairs for the lines under a text part.'
+    for child in part.children:
+        if isinstance(child, tei.TextPart):
+            yield from _walk(child, path + [child.name])
+        elif isinstance(child, tei.Line):
+            yield path, child
+
+
+def line_records(doc):
+    '''Generate a dictionary describing each line of a document.
+
+    Lines of the edition carry the language of the document,
+    lines of translations the language of the translation.'''
+    code = doc.header.cdli_code if doc.header else None
+    for part in doc.parts:
+        language = part.language
+        if isinstance(part, tei.Edition):
+            language = language or doc.language
+        for path, line in _walk(part, []):
+            yield {
+                'code': code,
+                'part': part.type,
+                'language': language,
+                'object': path[0] if path else None,
+                'surface': path[-1] if len(path) > 1 else None,
+                'label': line.ref,
+                'text': line.text,
+            }
+
+
+def document_record(doc):
+    'Return a dictionary describing a whole document.'
+    lines = []
+    for record in line_records(doc):
+        del record['code']
+        lines.append(record)
+    return {
+        'code': doc.header.cdli_code if doc.header else None,
+        'title': doc.header.title if doc.header else None,
+        'language': doc.language,
+        'lines': lines,
+    }
+
+
+def dumps(record):
+    'Serialize a record as a compact line of JSON.'
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+
+def write(doc, f, per='line'):
+    '''Write a document to a text stream as NDJSON.
+
+    Pass per='document' for a single record holding every line,
+    or per='line' for one record per line.'''
+    if per == 'document':
+        f.write(dumps(document_record(doc)) + '\n')
+    elif per == 'line':
+        for record in line_records(doc):
+            f.write(dumps(record) + '\n')
+    else:
+        raise ValueError(f'Unknown record type {per!r}')
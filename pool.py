@@ -0,0 +1,288 @@
+'''Process pool which recycles workers to bound their memory use.
+
+Long conversion runs grow the resident size of each worker through
+parse trees, cached objects and heap fragmentation. This pool
+replaces a worker after a number of tasks or once its resident set
+passes a ceiling. Workers only retire between tasks, and a task
+whose worker dies is run again on a replacement, so no record is
+lost. The peak memory of every worker is kept for reporting.'''
+
+import collections
+import multiprocessing
+import os
+import sys
+
+from multiprocessing.connection import wait
+
+
+# Summary of a finished worker process.
+WorkerStats = collections.namedtuple('WorkerStats',
+                                     'pid tasks peak_rss reason')
+
+
+def rss():
+    'Return the current resident set size in bytes, or None if unknown.'
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def peak_rss():
+    'Return the peak resident set size of this process in bytes.'
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def _worker(conn, max_tasks, max_rss):
+    '''Run tasks received over a pipe until told to stop or retiring.
+
+    Sends ('result', ok, value, retired) for each task, where retired
+    is None or the (tasks, peak_rss, reason) of a worker about to
+    exit, and ('exit', tasks, peak_rss, reason) when told to stop.'''
+    import signal
+
+    # Leave interrupts to the parent, which stops the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    tasks = 0
+    while True:
+        task = conn.recv()
+        if task is None:
+            conn.send(('exit', tasks, peak_rss(), 'done'))
+            break
+        func, arg = task
+        try:
+            ok, value = True, func(arg)
+        except Exception as e:
+            ok, value = False, e
+        tasks += 1
+        # Decide whether to retire before replying, so the parent
+        # never hands a new task to a worker which is leaving.
+        reason = None
+        if max_tasks and tasks >= max_tasks:
+            reason = 'max tasks'
+        elif max_rss and (rss() or 0) > max_rss:
+            reason = 'max rss'
+        retired = (tasks, peak_rss(), reason) if reason else None
+        try:
+            conn.send(('result', ok, value, retired))
+        except Exception as e:
+            # The result could not be pickled.
+            conn.send(('result', False, RuntimeError(str(e)), retired))
+        if retired:
+            break
+    conn.close()
+
+
+class WorkerError(Exception):
+    '''Raised when a task repeatedly kills the worker running it.
+
+    The item attribute holds the item the task was called with.'''
+
+    def __init__(self, message, item):
+        super().__init__(message)
+        self.item = item
+
+
+class _Worker:
+    '''Parent side handle on a worker process.'''
+
+    def __init__(self, context, max_tasks, max_rss):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker,
+                                       args=(child, max_tasks, max_rss),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        # The (index, arg, attempts) task being run, if any.
+        self.task = None
+
+
+class Pool:
+    '''Pool of worker processes with memory-aware recycling.
+
+    Workers are replaced after max_tasks tasks, or once their
+    resident set exceeds max_rss bytes after a task. Either limit
+    may be None. Finished workers are listed in the stats
+    attribute as WorkerStats tuples.'''
+
+    def __init__(self, processes=None, max_tasks=None, max_rss=None,
+                 retries=1):
+        self.processes = processes or os.cpu_count() or 1
+        self.max_tasks = max_tasks
+        self.max_rss = max_rss
+        self.retries = retries
+        self.context = multiprocessing.get_context()
+        self.workers = []
+        self.stats = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def _start(self):
+        worker = _Worker(self.context, self.max_tasks, self.max_rss)
+        self.workers.append(worker)
+        return worker
+
+    def _finish(self, worker, stats):
+        'Record a finished worker and remove it from the pool.'
+        worker.process.join()
+        worker.conn.close()
+        self.workers.remove(worker)
+        self.stats.append(stats)
+
+    def _receive(self, worker, results, retry):
+        '''Handle messages from a worker which is ready.
+
+        Completed tasks are appended to results as (ok, value)
+        pairs, and tasks lost to a dead worker to retry, or to
+        results as a WorkerError once out of retries.'''
+        while True:
+            try:
+                if not worker.conn.poll():
+                    break
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == 'result':
+                _, ok, value, retired = message
+                results.append((ok, value))
+                worker.task = None
+            else:
+                retired = message[1:]
+            if retired:
+                self._finish(worker, WorkerStats(worker.process.pid,
+                                                 *retired))
+                return
+        if not worker.process.is_alive():
+            # Killed without reporting, perhaps by the OOM killer.
+            worker.process.join()
+            stats = WorkerStats(worker.process.pid, None, None,
+                                f'exit code {worker.process.exitcode}')
+            self._finish(worker, stats)
+            if worker.task is not None:
+                index, arg, attempts = worker.task
+                if attempts >= self.retries:
+                    error = WorkerError(f'Worker {worker.process.pid} '
+                                        f'exited with code '
+                                        f'{worker.process.exitcode} '
+                                        f'running task {index}', arg)
+                    results.append((False, error))
+                else:
+                    retry.append((index, arg, attempts + 1))
+
+    def imap_unordered(self, func, iterable, return_errors=False):
+        '''Apply func to each item of iterable, generating results
+        in completion order.
+
+        Items are read from iterable as workers become free, so it
+        may be an arbitrarily long generator. An exception raised
+        by func, or a WorkerError for an item which repeatedly kills
+        its worker, is raised again here. If that, or the caller,
+        stops the generator early, results of tasks still running
+        are discarded so the pool can be used again. Pass
+        return_errors to generate these exceptions as results
+        instead, and carry on with the remaining items.'''
+        try:
+            yield from self._imap_unordered(func, iterable, return_errors)
+        except KeyboardInterrupt:
+            self.terminate()
+            raise
+        finally:
+            self._drain()
+
+    def _imap_unordered(self, func, iterable, return_errors):
+        items = enumerate(iterable)
+        retry = collections.deque()
+        while True:
+            # Hand out one task to each idle worker, starting
+            # replacements for retired workers only when needed.
+            idle = [worker for worker in self.workers if worker.task is None]
+            busy = len(self.workers) - len(idle)
+            while busy < self.processes:
+                if retry:
+                    task = retry.popleft()
+                else:
+                    try:
+                        index, arg = next(items)
+                    except StopIteration:
+                        break
+                    task = index, arg, 0
+                worker = idle.pop() if idle else self._start()
+                worker.task = task
+                worker.conn.send((func, task[1]))
+                busy += 1
+
+            busy = [worker for worker in self.workers
+                    if worker.task is not None]
+            if not busy:
+                break
+            ready = wait([worker.conn for worker in busy] +
+                         [worker.process.sentinel for worker in busy])
+            results = []
+            for worker in busy:
+                if worker.conn in ready or worker.process.sentinel in ready:
+                    self._receive(worker, results, retry)
+            for ok, value in results:
+                if not ok and not return_errors:
+                    raise value
+                yield value
+
+    def _drain(self):
+        'Wait for running tasks to finish, discarding their results.'
+        while True:
+            busy = [worker for worker in self.workers
+                    if worker.task is not None]
+            if not busy:
+                break
+            ready = wait([worker.conn for worker in busy] +
+                         [worker.process.sentinel for worker in busy])
+            for worker in busy:
+                if worker.conn in ready or worker.process.sentinel in ready:
+                    self._receive(worker, [], collections.deque())
+
+    def close(self):
+        'Stop idle workers once they finish, and wait for them.'
+        for worker in list(self.workers):
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        while self.workers:
+            worker = self.workers[0]
+            wait([worker.conn, worker.process.sentinel])
+            self._receive(worker, [], collections.deque())
+
+    def terminate(self):
+        'Stop all workers immediately.'
+        for worker in self.workers:
+            worker.process.terminate()
+        for worker in self.workers:
+            worker.process.join()
+            worker.conn.close()
+        self.workers = []
+
+    def report(self, top=10):
+        'Print worker recycling counts and the highest peak memory.'
+        reasons = collections.Counter(stats.reason for stats in self.stats)
+        print(f'Ran {len(self.stats)} worker processes:',
+              ', '.join(f'{count} {reason}'
+                        for reason, count in reasons.most_common()))
+        measured = [stats for stats in self.stats if stats.peak_rss]
+        measured.sort(key=lambda stats: stats.peak_rss, reverse=True)
+        if measured:
+            print(f'Peak worker memory (top {min(top, len(measured))}):')
+        for stats in measured[:top]:
+            print(f'  pid {stats.pid:>7} {stats.tasks:7d} tasks',
+                  f'{stats.peak_rss / 2**20:8.1f} MB  {stats.reason}')
@@ -0,0 +1,169 @@
+'''Helpers for profiling conversions across worker processes.
+
+cProfile only sees the process it runs in, so each worker profiles
+its own calls and hands the raw statistics back to the parent,
+which merges them into a single pstats.Stats object.'''
+
+import cProfile
+import os
+import pstats
+
+
+# Function categories used to attribute time in reports.
+categories = ('pyoracc', 'normalization', 'serialization', 'other')
+
+
+def run(func, *args):
+    '''Call func with the given arguments under cProfile.
+
+    Returns a (result, stats) tuple. The stats are the raw
+    dictionary collected by cProfile, which can be pickled
+    across process boundaries and passed to Aggregate.add.'''
+    profile = cProfile.Profile()
+    result = profile.runcall(func, *args)
+    profile.create_stats()
+    return result, profile.stats
+
+
+def category(func):
+    '''Attribute a pstats function key to one of the categories.
+
+    Functions outside the converter stages, such as the standard
+    library, return None and inherit the category of their caller.'''
+    filename, _, name = func
+    path = filename.replace(os.sep, '/')
+    if '/pyoracc/' in path or '/ply/' in path or '/mako/' in path:
+        return 'pyoracc'
+    if name in ('tokenize_transliteration', 'normalize_transliteration'):
+        return 'normalization'
+    module = os.path.basename(path)
+    if module in ('tei.py', 'cts.py') or '/xml/' in path:
+        return 'serialization'
+    return None
+
+
+class _RawStats:
+    '''Adapter letting pstats load a bare stats dictionary.'''
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Aggregate:
+    '''Accumulates profile statistics from many worker calls.'''
+
+    def __init__(self):
+        self.stats = pstats.Stats()
+        self.calls = 0
+        self._collapsed = None
+
+    def add(self, stats):
+        'Merge a raw stats dictionary returned by run().'
+        if stats:
+            self.stats.add(_RawStats(stats))
+            self.calls += 1
+            self._collapsed = None
+
+    def dump(self, filename):
+        'Write merged statistics in pstats format.'
+        self.stats.dump_stats(filename)
+
+    def stacks(self):
+        '''Generate (stack, seconds) pairs reconstructed from the profile.
+
+        cProfile only records caller/callee edges, not full stacks,
+        so stacks are reconstructed by walking the call graph from
+        its roots and splitting each function's time between its
+        callers in proportion to the cumulative time of each edge.'''
+        stats = self.stats.stats
+        callees = {}
+        for func, (_, _, _, _, callers) in stats.items():
+            for caller in callers:
+                callees.setdefault(caller, []).append(func)
+        roots = [func for func, (_, _, _, _, callers) in stats.items()
+                 if not callers]
+
+        def walk(func, path, scale):
+            _, _, tt, ct, _ = stats[func]
+            if ct * scale < 1e-6:
+                # Too little time to show up in a flame graph.
+                return
+            path = path + [func]
+            if tt * scale > 0:
+                yield path, tt * scale
+            for callee in callees.get(func, []):
+                if callee in path:
+                    # Recursion; its time is already counted in place.
+                    continue
+                _, _, _, edge_ct = stats[callee][4][func][:4]
+                callee_ct = stats[callee][3]
+                if not callee_ct or not edge_ct:
+                    continue
+                share = scale * edge_ct / callee_ct
+                yield from walk(callee, path, share)
+
+        for root in roots:
+            yield from walk(root, [], 1.0)
+
+    def collapsed(self):
+        '''Return a dictionary mapping stacks to seconds.
+
+        Stacks are tuples of pstats function keys, with identical
+        stacks merged. Walking the call graph is expensive, so the
+        result is kept until more statistics are added.'''
+        if self._collapsed is None:
+            totals = {}
+            for path, seconds in self.stacks():
+                path = tuple(path)
+                totals[path] = totals.get(path, 0) + seconds
+            self._collapsed = totals
+        return self._collapsed
+
+    def write_collapsed(self, filename):
+        '''Write collapsed stacks for flame graph tools.
+
+        Identical stacks are merged and weights are in microseconds.'''
+        def label(func):
+            filename, lineno, name = func
+            if filename == '~':
+                return name
+            return f'{name} ({os.path.basename(filename)}:{lineno})'
+
+        totals = {}
+        for path, seconds in self.collapsed().items():
+            path = ';'.join(label(func) for func in path)
+            totals[path] = totals.get(path, 0) + seconds
+        with open(filename, mode='w', encoding='utf-8') as f:
+            for path, seconds in totals.items():
+                weight = int(seconds * 1e6)
+                if weight:
+                    f.write(f'{path} {weight}\n')
+
+    def report(self, top=20):
+        'Print the top functions by cumulative time, with attribution.'
+        stats = self.stats.stats
+        # Charge each stack's time to its innermost categorized frame.
+        totals = dict.fromkeys(categories, 0.0)
+        for path, seconds in self.collapsed().items():
+            owners = filter(None, map(category, reversed(path)))
+            totals[next(owners, 'other')] += seconds
+        overall = sum(totals.values()) or 1.0
+        print(f'Profiled {self.calls} conversions,',
+              f'{overall:0.3f} seconds of worker time.')
+        for name in categories:
+            share = totals[name] / overall * 100
+            print(f'  {name:>14} {totals[name]:9.3f}s {share:5.1f}%')
+
+        print(f'Top {top} functions by cumulative time:')
+        print(f'  {"ncalls":>9} {"tottime":>9} {"cumtime":>9}',
+              f'{"category":>14}  function')
+        ranked = sorted(stats.items(), key=lambda item: item[1][3],
+                        reverse=True)
+        for func, (_, nc, tt, ct, _) in ranked[:top]:
+            filename, lineno, name = func
+            where = f'{os.path.basename(filename)}:{lineno}({name})'
+            print(f'  {nc:9d} {tt:9.3f} {ct:9.3f}',
+                  f'{category(func) or "-":>14}  {where}')
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+'''Check that ATF survives conversion to TEI and back.
+
+Each record is converted to TEI XML with atf2tei, back to ATF with
+tei2atf, and parsed again. The labelled lines of the edition and of
+every translation are compared between the first and second parse,
+and any differences are reported by category as results arrive.
+
+Breaks which span lines are compared as if closed within each
+line, since TEI cannot distinguish them from breaks on one line.
+
+Interlinear translations are labelled in TEI by line number alone,
+so where a number repeats on several surfaces tei2atf attaches the
+translation to its first matching line; these are still compared
+in order.
+
+Usage: python roundtrip.py [--sample FRACTION] [--seed N] FILE...
+exits with status 1 if any record fails to round-trip.
+'''
+
+import io
+
+import atf2tei
+import ndjson
+import tei2atf
+
+
+# Mismatch categories, in reporting order.
+categories = (
+    'parse',    # The original record could not be converted.
+    'export',   # tei2atf failed on the converted XML.
+    'reparse',  # The regenerated ATF could not be converted.
+    'header',   # The CDLI code or language changed.
+    'part',     # A whole edition or translation was lost or added.
+    'missing',  # A line label was lost.
+    'extra',    # A line label appeared.
+    'text',     # The text of a line changed.
+)
+
+
+def normalize(text):
+    '''Reduce line text to what survives conversion to TEI.
+
+    Whitespace is collapsed, and breaks opened or closed on another
+    line are closed within this one, since TEI marks the text lost
+    in each line separately and tei2atf writes paired brackets.'''
+    text = ' '.join(text.split())
+    depth = 0
+    for char in text:
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            if depth:
+                depth -= 1
+            else:
+                # Closes a break opened on an earlier line.
+                text = '[' + text
+    return text + ']' * depth
+
+
+def lines(doc):
+    '''Return a dictionary of the lines of each part of a document.
+
+    Parts are named 'edition' or 'translation' with a language, and
+    map (part, object, surface, label) locations to normalized text.
+    Repeated locations, as in interlinear translations, are told
+    apart by a count after the label.'''
+    result = {}
+    for record in ndjson.line_records(doc):
+        part = record['part']
+        if part != 'edition':
+            part = f'{part} {record["language"]}'
+        texts = result.setdefault(part, {})
+        label = record['label']
+        count = 1
+        while (part, record['object'], record['surface'], label) in texts:
+            count += 1
+            label = f'{record["label"]} ({count})'
+        key = part, record['object'], record['surface'], label
+        texts[key] = normalize(record['text'])
+    return result
+
+
+def check(atf):
+    '''Round-trip a single ATF record.
+
+    Returns a (code, mismatches) tuple, where mismatches is a list
+    of (category, location, expected, actual) tuples.'''
+    code = atf2tei.record_code(atf)
+    try:
+        doc = atf2tei.convert(atf)
+    except Exception as e:
+        return code, [('parse', None, None, str(e))]
+    try:
+        regenerated = tei2atf.convert(io.StringIO(str(doc)))
+    except Exception as e:
+        return code, [('export', None, None, str(e))]
+    try:
+        result = atf2tei.convert(regenerated)
+    except Exception as e:
+        return code, [('reparse', None, None, str(e))]
+
+    mismatches = []
+    for field in ('cdli_code', 'title'):
+        expected = getattr(doc.header, field)
+        actual = getattr(result.header, field)
+        if expected != actual:
+            mismatches.append(('header', field, expected, actual))
+    if doc.language != result.language:
+        mismatches.append(('header', 'language',
+                           doc.language, result.language))
+
+    expected_parts = lines(doc)
+    actual_parts = lines(result)
+    for part, expected in expected_parts.items():
+        if part not in actual_parts:
+            mismatches.append(('part', part, f'{len(expected)} lines', None))
+            continue
+        actual = actual_parts[part]
+        for key, text in expected.items():
+            if key not in actual:
+                mismatches.append(('missing', key, text, None))
+            elif actual[key] != text:
+                mismatches.append(('text', key, text, actual[key]))
+        for key, text in actual.items():
+            if key not in expected:
+                mismatches.append(('extra', key, None, text))
+    for part, actual in actual_parts.items():
+        if part not in expected_parts:
+            mismatches.append(('part', part, None, f'{len(actual)} lines'))
+    return code, mismatches
+
+
+def records(filenames, sample=1.0, seed=None):
+    'Generate ATF records from files, keeping a random fraction.'
+    import random
+
+    from atf2cts import segmentor
+
+    rng = random.Random(seed)
+    for filename in filenames:
+        with io.open(filename, encoding='utf-8') as f:
+            for atf in segmentor(f, verbose=False):
+                if sample >= 1.0 or rng.random() < sample:
+                    yield atf
+
+
+class Summary:
+    '''Tallies round-trip results by mismatch category.'''
+
+    def __init__(self, examples=3):
+        self.records = 0
+        self.failed = 0
+        self.counts = dict.fromkeys(categories, 0)
+        self.examples = {category: [] for category in categories}
+        self.max_examples = examples
+
+    def add(self, code, mismatches):
+        'Record the result of check() for one record.'
+        self.records += 1
+        if mismatches:
+            self.failed += 1
+        for mismatch in mismatches:
+            category = mismatch[0]
+            self.counts[category] += 1
+            if len(self.examples[category]) < self.max_examples:
+                self.examples[category].append((code,) + mismatch[1:])
+
+    def report(self, seconds):
+        'Print the tally with a few examples from each category.'
+        print(f'Round-tripped {self.records} records',
+              f'in {seconds:0.3f} seconds;',
+              f'{self.failed} with mismatches.')
+        for category in categories:
+            if not self.counts[category]:
+                continue
+            print(f'  {category:>8} {self.counts[category]:7d}')
+            for code, location, expected, actual in self.examples[category]:
+                print(f'           {code} {describe(location)}:',
+                      f'{expected!r} -> {actual!r}')
+
+
+def describe(location):
+    'Format a mismatch location for display.'
+    if isinstance(location, tuple):
+        return ' '.join(part for part in location if part)
+    return location or ''
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+
+    import pool
+
+    parser = argparse.ArgumentParser(
+        description='Check ATF survives conversion to TEI and back.')
+    parser.add_argument('filenames', metavar='FILE', nargs='+',
+                        help='ATF files to check')
+    parser.add_argument('--sample', metavar='FRACTION', type=float,
+                        default=1.0,
+                        help='check a random fraction of the records')
+    parser.add_argument('--seed', type=int,
+                        help='random seed for reproducible samples')
+    parser.add_argument('--processes', type=int,
+                        help='number of worker processes '
+                             '(default is the number of cores)')
+    parser.add_argument('--quiet', action='store_true',
+                        help='only print the final summary')
+    args = parser.parse_args()
+
+    summary = Summary()
+    start = time.perf_counter()
+    with pool.Pool(args.processes) as workers:
+        atfs = records(args.filenames, args.sample, args.seed)
+        # The pool reads a record only when a worker is free, so
+        # memory stays bounded and results stream as they finish.
+        for code, mismatches in workers.imap_unordered(check, atfs):
+            summary.add(code, mismatches)
+            if mismatches and not args.quiet:
+                for category, location, expected, actual in mismatches:
+                    print(f'{code}: {category} {describe(location)}:',
+                          f'{expected!r} -> {actual!r}')
+    summary.report(time.perf_counter() - start)
+    sys.exit(1 if summary.failed else 0)
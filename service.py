@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+'''HTTP service converting ATF to TEI XML or CTS part files.
+
+Conversion runs on a pool of warm worker processes, so requests
+don't pay for interpreter startup or parser construction. Results
+are cached by a hash of their content and identical requests which
+arrive while a conversion is running share its result.
+
+Endpoints:
+
+    POST /tei      ATF request body, returns TEI XML.
+    POST /cts      ATF request body, returns a JSON object mapping
+                   paths in a CTS data directory to their XML.
+    GET /metrics   Returns request, cache and latency counters as JSON.
+'''
+
+import asyncio
+import collections
+import hashlib
+import json
+import time
+
+import atf2cts
+import atf2tei
+
+
+def render_tei(atf):
+    'Convert an ATF record to encoded TEI XML.'
+    return str(atf2tei.convert(atf)).encode('utf-8')
+
+
+def render_cts(atf):
+    'Convert an ATF record to an encoded JSON object of CTS files.'
+    doc = atf2tei.convert(atf)
+    files = {path: xml for path, _, xml in atf2cts.export(doc)}
+    return json.dumps(files).encode('utf-8')
+
+
+# Map request paths to (worker function, content type).
+routes = {
+    '/tei': (render_tei, 'application/tei+xml; charset=utf-8'),
+    '/cts': (render_cts, 'application/json; charset=utf-8'),
+}
+
+# Small record used to warm up worker processes.
+warmup_atf = '''&X000000 = warmup
+#atf: lang akk
+@tablet
+@obverse
+1. a-na
+'''
+
+
+class RequestError(Exception):
+    '''Raised for a request which can't be read, with a status line.'''
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LRUCache:
+    '''Least-recently-used cache bounded by the total size of its values.'''
+
+    def __init__(self, size):
+        self.size = size
+        self.used = 0
+        self.entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        'Return the value for key, or None if it is not cached.'
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        'Store a value, evicting old entries to stay within size.'
+        if len(value) > self.size:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.used -= len(old)
+        self.entries[key] = value
+        self.used += len(value)
+        while self.used > self.size:
+            _, old = self.entries.popitem(last=False)
+            self.used -= len(old)
+
+
+class Metrics:
+    '''Counters describing service performance.'''
+
+    def __init__(self, samples=1000):
+        self.requests = 0
+        self.errors = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # Recent request latencies, for percentiles.
+        self.latencies = collections.deque(maxlen=samples)
+        self.latency_count = 0
+        self.latency_total = 0.0
+
+    def record(self, seconds):
+        'Record the latency of a conversion request.'
+        self.latencies.append(seconds)
+        self.latency_count += 1
+        self.latency_total += seconds
+
+    def percentile(self, fraction):
+        'Return the given percentile of recent latencies in seconds.'
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(fraction * len(ordered)))
+        return ordered[index]
+
+    def summary(self, cache):
+        'Return a dictionary of metrics suitable for JSON encoding.'
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'cache': {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': len(cache),
+                'bytes': cache.used,
+                'capacity': cache.size,
+            },
+            'latency': {
+                'count': self.latency_count,
+                'mean': (self.latency_total / self.latency_count
+                         if self.latency_count else 0.0),
+                'p50': self.percentile(0.5),
+                'p95': self.percentile(0.95),
+                'p99': self.percentile(0.99),
+                'max': max(self.latencies, default=0.0),
+            },
+        }
+
+
+class Service:
+    '''Conversion service with a content-addressed result cache.
+
+    Pass an executor to run conversions on, usually a
+    ProcessPoolExecutor. The default executor of the event
+    loop is used otherwise. Request bodies larger than
+    max_body bytes are refused.'''
+
+    def __init__(self, executor=None, cache_size=64 * 1024 * 1024,
+                 max_body=16 * 1024 * 1024):
+        self.executor = executor
+        self.max_body = max_body
+        self.cache = LRUCache(cache_size)
+        self.metrics = Metrics()
+        self.inflight = {}
+
+    async def warmup(self, count):
+        'Run a small conversion count times to start the workers.'
+        loop = asyncio.get_running_loop()
+        jobs = [loop.run_in_executor(self.executor, render_tei, warmup_atf)
+                for _ in range(count)]
+        await asyncio.gather(*jobs)
+
+    async def convert(self, path, atf):
+        '''Return the converted result for a route and ATF string.
+
+        Raises KeyError for an unknown path and propagates any
+        exception raised by the conversion.'''
+        func, _ = routes[path]
+        key = hashlib.sha256(f'{path}\0{atf}'.encode('utf-8')).hexdigest()
+
+        result = self.cache.get(key)
+        if result is not None:
+            self.metrics.hits += 1
+            return result
+
+        future = self.inflight.get(key)
+        if future is not None:
+            self.metrics.coalesced += 1
+        else:
+            self.metrics.misses += 1
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, func, atf)
+            self.inflight[key] = future
+            future.add_done_callback(
+                lambda future: self._finished(key, future))
+        # Shield the shared conversion from cancellation of any
+        # one request waiting on it.
+        return await asyncio.shield(future)
+
+    def _finished(self, key, future):
+        'Cache a completed conversion.'
+        del self.inflight[key]
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result())
+
+    async def handle(self, reader, writer):
+        'Serve HTTP/1.1 requests on a client connection.'
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except RequestError as e:
+                    # The body was not read, so the connection
+                    # can't be used for another request.
+                    message = f'{e}\n'.encode('utf-8')
+                    await self.send(writer, e.status,
+                                    'text/plain; charset=utf-8',
+                                    message, False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, content_type, content = await self.respond(
+                    method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.send(writer, status, content_type, content,
+                                keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, content_type, content, keep_alive):
+        'Write an HTTP response.'
+        head = [
+            f'HTTP/1.1 {status}',
+            f'Content-Type: {content_type}',
+            f'Content-Length: {len(content)}',
+            'Connection: ' + ('keep-alive' if keep_alive else 'close'),
+        ]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('ascii'))
+        writer.write(content)
+        await writer.drain()
+
+    async def read_request(self, reader):
+        '''Read an HTTP request from a stream.
+
+        Returns a (method, path, headers, body) tuple,
+        or None if the client closed the connection.
+        Raises RequestError for an invalid or too large body.'''
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            line = line.decode('latin-1').strip()
+            if not line:
+                break
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise RequestError('400 Bad Request', 'Invalid Content-Length.')
+        if length > self.max_body:
+            raise RequestError('413 Content Too Large',
+                               f'Request body is limited to '
+                               f'{self.max_body} bytes.')
+        body = await reader.readexactly(length)
+        return method, path, headers, body
+
+    async def respond(self, method, path, body):
+        'Return (status, content type, encoded content) for a request.'
+        text_plain = 'text/plain; charset=utf-8'
+        if path == '/metrics':
+            if method != 'GET':
+                return '405 Method Not Allowed', text_plain, b'Use GET.\n'
+            metrics = json.dumps(self.metrics.summary(self.cache))
+            return '200 OK', 'application/json', metrics.encode('utf-8')
+        if path not in routes:
+            return '404 Not Found', text_plain, b'No route.\n'
+        if method != 'POST':
+            return '405 Method Not Allowed', text_plain, b'Use POST.\n'
+
+        self.metrics.requests += 1
+        start = time.perf_counter()
+        try:
+            atf = body.decode('utf-8')
+            result = await self.convert(path, atf)
+        except Exception as e:
+            self.metrics.errors += 1
+            message = f'Error converting ATF: {e}\n'
+            return '422 Unprocessable Entity', text_plain, \
+                message.encode('utf-8')
+        finally:
+            self.metrics.record(time.perf_counter() - start)
+        _, content_type = routes[path]
+        return '200 OK', content_type, result
+
+
+async def serve(host, port, processes=None, cache_size=64 * 1024 * 1024,
+                max_body=16 * 1024 * 1024):
+    'Run the conversion service until cancelled.'
+    import os
+
+    from concurrent import futures
+
+    processes = processes or os.cpu_count()
+    with futures.ProcessPoolExecutor(processes) as exe:
+        service = Service(exe, cache_size, max_body)
+        await service.warmup(processes)
+        server = await asyncio.start_server(service.handle, host, port)
+        for sock in server.sockets:
+            print('Serving on', sock.getsockname())
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Serve ATF conversions over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on (default %(default)s)')
+    parser.add_argument('--port', type=int, default=8080,
+                        help='port to listen on (default %(default)s)')
+    parser.add_argument('--processes', type=int,
+                        help='number of worker processes '
+                             '(default is the number of cores)')
+    parser.add_argument('--cache-size', metavar='MB', type=int, default=64,
+                        help='result cache size in megabytes '
+                             '(default %(default)s)')
+    parser.add_argument('--max-body', metavar='MB', type=int, default=16,
+                        help='largest request body accepted in megabytes '
+                             '(default %(default)s)')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.processes,
+                          args.cache_size * 1024 * 1024,
+                          args.max_body * 1024 * 1024))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+'''Storage backends for converted CTS file repositories.
+
+A full corpus produces several small files per record. As an
+alternative to writing them into the data directory, they can be
+stored in a single SQLite database keyed by CTS URN, and exported
+to the standard directory layout when needed.
+
+Usage: python store.py DATABASE [DATA_PATH]
+exports a database to a data directory, by default 'data'.
+'''
+
+import io
+import os
+import sqlite3
+
+
+class DirectoryStore:
+    '''Writes files into the data directory of a CTS file repository.'''
+
+    def __init__(self, data_path):
+        self.data_path = data_path
+
+    def write(self, path, urn, xml):
+        '''Write a file at a path relative to the data directory.
+
+        The file is written under a temporary name and renamed into
+        place, so readers never see a partially written file. The
+        temporary name is unique to this process, since workers may
+        write records with the same code concurrently.'''
+        filename = os.path.join(self.data_path, *path.split('/'))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        temporary = f'{filename}.{os.getpid()}.tmp'
+        with io.open(temporary, encoding='utf-8', mode='w') as f:
+            f.write(xml)
+        os.replace(temporary, filename)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+    '''Writes files into a single SQLite database, keyed by URN.
+
+    Writes are buffered and committed in transactions of
+    batch_size files. Call close to commit any remainder.'''
+
+    schema = '''CREATE TABLE IF NOT EXISTS files (
+        urn TEXT PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        xml TEXT NOT NULL
+    )'''
+
+    def __init__(self, filename, batch_size=1000):
+        self.db = sqlite3.connect(filename)
+        # Each batch is one transaction, so a crash loses at most
+        # the current batch, and the database stays consistent.
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.execute(self.schema)
+        self.batch_size = batch_size
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, path, urn, xml):
+        'Store a file, replacing any earlier version.'
+        self.pending.append((urn, path.replace(os.sep, '/'), xml))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        'Commit buffered files in a single transaction.'
+        if self.pending:
+            with self.db:
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?)',
+                    self.pending)
+            self.pending = []
+
+    def close(self):
+        'Commit buffered files and close the database.'
+        self.flush()
+        self.db.close()
+
+    def read(self, urn):
+        'Return the XML stored for a URN, or None.'
+        self.flush()
+        row = self.db.execute('SELECT xml FROM files WHERE urn = ?',
+                              (urn,)).fetchone()
+        return row[0] if row else None
+
+    def files(self):
+        'Generate (path, urn, xml) tuples for every stored file.'
+        self.flush()
+        cursor = self.db.execute('SELECT path, urn, xml FROM files '
+                                 'ORDER BY path')
+        yield from cursor
+
+    def export(self, data_path):
+        '''Write every stored file under a CTS data directory.
+
+        returns the number of files written.'''
+        directory = DirectoryStore(data_path)
+        count = 0
+        for path, urn, xml in self.files():
+            directory.write(path, urn, xml)
+            count += 1
+        return count
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Export a CTS database to a data directory.')
+    parser.add_argument('database', help='SQLite database to read')
+    parser.add_argument('data_path', nargs='?', default='data',
+                        help='data directory to write '
+                             '(default %(default)s)')
+    args = parser.parse_args()
+
+    with SQLiteStore(args.database) as db:
+        count = db.export(args.data_path)
+    print(f'Exported {count} files to {args.data_path}')
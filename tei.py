@@ -2,11 +2,32 @@
 
 import io
 import xml.etree.ElementTree as ET
-from xml.dom.minidom import parseString
+from collections import namedtuple
 
 namespace = 'http://www.tei-c.org/ns/1.0'
 
 
+def indent(xml, level=0, space='  '):
+    '''Add whitespace to an ElementTree so it serializes legibly.
+
+    Only elements whose content is entirely other elements are
+    indented, so no whitespace is added inside mixed content.
+    Lines are never indented, since whitespace between their
+    signs is part of the text, even when a line is made only
+    of marked-up signs.'''
+    children = list(xml)
+    if not children or xml.tag.rsplit('}', 1)[-1] == 'l':
+        return
+    if xml.text or any(child.tail for child in children):
+        return
+    prefix = '\n' + space * (level + 1)
+    xml.text = prefix
+    for child in children:
+        indent(child, level + 1, space)
+        child.tail = prefix
+    children[-1].tail = '\n' + space * level
+
+
 class XMLSerializer:
     '''Mixin for XML serialization.
 
@@ -17,9 +38,10 @@ class XMLSerializer:
 
     def __str__(self):
         'Serialized XML representation as a string.'
-        serialized = ET.tostring(self.xml, encoding='unicode')
-        # Run the xml through minidom to control the indent.
-        return parseString(serialized).toprettyxml(indent='  ')
+        xml = self.xml
+        indent(xml)
+        serialized = ET.tostring(xml, encoding='unicode')
+        return '<?xml version="1.0" ?>\n' + serialized + '\n'
 
     def write(self, filename):
         'Write a serialized representation to the given file path.'
@@ -35,6 +57,10 @@ class Document(XMLSerializer):
         self.parts = []
         self.language = None
 
+    def append(self, part):
+        'Append a part to the document.'
+        self.parts.append(part)
+
     @property
     def xml(self):
         'Construct an XML representation of member data.'
@@ -137,20 +163,141 @@ class Translation(TextPart):
         self.type = 'translation'
 
 
+class Token(namedtuple('Token', 'kind text damaged', defaults=(False,))):
+    '''A typed fragment of transliterated text.
+
+    The kind is one of 'sign', 'logogram', 'determinative',
+    'numeral', 'gap', 'break_open', 'break_close' or 'text'.
+    Set damaged for a sign which is damaged but legible.'''
+
+    __slots__ = ()
+
+    def __str__(self):
+        'Plain text representation.'
+        text = self.text
+        if self.kind == 'determinative':
+            text = '{' + text + '}'
+        if self.damaged:
+            text = '⸢' + text + '⸣'
+        return text
+
+    @property
+    def xml(self):
+        '''Construct an XML ElementTree representation.
+
+        Returns None for undamaged signs and other plain text, and
+        for breakage, which Line handles since it can span tokens.'''
+        if self.kind == 'gap':
+            xml = ET.Element('gap')
+            xml.set('reason', 'lost')
+            xml.set('extent', 'unknown')
+            xml.set('unit', 'character')
+            return xml
+        if self.kind == 'determinative':
+            xml = ET.Element('c')
+            xml.set('type', 'determinative')
+        elif self.kind == 'logogram':
+            xml = ET.Element('c')
+            xml.set('type', 'sign')
+            xml.set('subtype', 'logo')
+        elif self.kind == 'numeral':
+            xml = ET.Element('num')
+        elif self.damaged:
+            xml = None
+        else:
+            return None
+        if xml is not None:
+            xml.text = self.text
+        if not self.damaged:
+            return xml
+        damage = ET.Element('damage')
+        if xml is None:
+            damage.text = self.text
+        else:
+            damage.append(xml)
+        return damage
+
+
+def _append_text(xml, text):
+    'Append text after any existing content of an element.'
+    if len(xml):
+        xml[-1].tail = (xml[-1].tail or '') + text
+    else:
+        xml.text = (xml.text or '') + text
+
+
 class Line(XMLSerializer):
-    '''Represents a line of text.'''
+    '''Represents a line of text.
+
+    The content may be a string, or a list of Token objects
+    which are serialized as the corresponding elements.'''
     def __init__(self, ref, content):
         self.ref = ref
         self.content = content
 
+    @property
+    def text(self):
+        'Plain text of the line content.'
+        if isinstance(self.content, str):
+            return self.content
+        return ''.join(str(token) for token in self.content)
+
     @property
     def xml(self):
         'Construct an XML ElementTree representation.'
         xml = ET.Element('l')
         xml.set('n', self.ref)
-        xml.text = self.content
+        if isinstance(self.content, str):
+            xml.text = self.content
+            return xml
+        # Breakage is marked as supplied text, which may enclose
+        # several tokens, so split the line into spans inside and
+        # outside breaks. A break left open runs to the end of the
+        # line, and one closed without being opened on this line
+        # runs from its start.
+        spans = []
+        broken = _opens_broken(self.content)
+        tokens = []
+        for token in self.content:
+            if token.kind in ('break_open', 'break_close'):
+                if broken != (token.kind == 'break_open'):
+                    spans.append((broken, tokens))
+                    broken = not broken
+                    tokens = []
+                continue
+            tokens.append(token)
+        spans.append((broken, tokens))
+
+        for broken, tokens in spans:
+            parent = xml
+            # Only wrap spans with some legible content; a lost
+            # gap on its own is not text supplied by the editor.
+            if broken and any(token.kind != 'gap' and str(token).strip()
+                              for token in tokens):
+                parent = ET.SubElement(xml, 'supplied')
+                parent.set('reason', 'lost')
+            for token in tokens:
+                element = token.xml
+                if element is None:
+                    _append_text(parent, str(token))
+                    continue
+                if token.kind == 'gap' and not broken:
+                    # Ellipsis outside a break marks illegible signs.
+                    element.set('reason', 'illegible')
+                parent.append(element)
         return xml
 
+
+def _opens_broken(tokens):
+    'Return true if the first break marker in tokens closes a break.'
+    for token in tokens:
+        if token.kind == 'break_open':
+            return False
+        if token.kind == 'break_close':
+            return True
+    return False
+
+
 class Note(XMLSerializer):
     '''Represents an annotation.'''
     def __init__(self, text):
@@ -162,3 +309,64 @@ class Note(XMLSerializer):
         xml = ET.Element('note')
         xml.text = self.text
         return xml
+
+
+class EventWriter:
+    '''Serializes conversion events incrementally to a text stream.
+
+    Accepts the (event, object) pairs generated by atf2tei.events
+    and writes the same XML as str(Document), but each line is
+    written as soon as it is generated rather than after the whole
+    document has been built and pretty-printed.'''
+
+    def __init__(self, f, indent='  '):
+        self.f = f
+        self.indent = indent
+
+    def write(self, events):
+        'Write a complete document from a sequence of events.'
+        f = self.f
+        depth = 0
+        # Names of the currently open part elements.
+        tags = []
+        # Start tag of the most recently opened part, written once
+        # we know whether it has any content.
+        pending = None
+        for event, obj in events:
+            if pending is not None and event != 'end':
+                f.write(self.indent * (depth - 1) + pending + '>\n')
+                pending = None
+            if event == 'start' and isinstance(obj, Document):
+                f.write('<?xml version="1.0" ?>\n')
+                f.write(f'<TEI xmlns="{namespace}">\n')
+                if obj.header:
+                    header = obj.header.xml
+                    indent(header, 1, self.indent)
+                    header = ET.tostring(header, encoding='unicode')
+                    f.write(self.indent + header + '\n')
+                f.write(self.indent + '<text>\n')
+                f.write(self.indent * 2 + '<body>\n')
+                depth = 3
+            elif event == 'start':
+                # Serialize the empty element and drop the ' />'.
+                element = obj.xml
+                tags.append(element.tag)
+                pending = ET.tostring(element, encoding='unicode')[:-3]
+                depth += 1
+            elif event == 'child':
+                element = obj.xml
+                indent(element, depth, self.indent)
+                element = ET.tostring(element, encoding='unicode')
+                f.write(self.indent * depth + element + '\n')
+            elif event == 'end' and isinstance(obj, Document):
+                f.write(self.indent * 2 + '</body>\n')
+                f.write(self.indent + '</text>\n')
+                f.write('</TEI>\n')
+            elif event == 'end':
+                depth -= 1
+                tag = tags.pop()
+                if pending is not None:
+                    f.write(self.indent * depth + pending + ' />\n')
+                    pending = None
+                else:
+                    f.write(self.indent * depth + f'</{tag}>\n')
@@ -5,6 +5,7 @@
 Used by the Cuneiform Digital Library Initiative.
 '''
 
+import collections
 import io
 import sys
 import xml.etree.ElementTree as ET
@@ -12,10 +13,105 @@ import xml.etree.ElementTree as ET
 import tei
 
 
-def add_line(atf, line):
+def _pieces(element, ns, broken=False):
+    '''Generate [text, kind] pairs reconstructing ATF from line markup.
+
+    The kind is 'logogram' for logograms written in lower case,
+    which ATF marks with underscores, 'sign' for other text
+    containing signs, and None for separators and markup.
+    Set broken inside supplied text, whose brackets are
+    already written.'''
+    tag = element.tag.replace(f'{{{ns["tei"]}}}', '')
+    if tag == 'c' and element.get('type') == 'determinative':
+        yield ['{' + (element.text or '') + '}', None]
+    elif tag == 'c' and element.get('subtype') == 'logo':
+        text = element.text or ''
+        yield [text, None if text.isupper() else 'logogram']
+    elif tag == 'num':
+        yield [''.join(element.itertext()), None]
+    elif tag == 'gap':
+        if element.get('reason') == 'lost' and not broken:
+            yield ['[...]', None]
+        else:
+            yield ['...', None]
+    elif tag == 'damage':
+        pieces = list(_content(element, ns, broken))
+        if pieces:
+            # Flag the damaged sign itself.
+            pieces[-1][0] += '#'
+        yield from pieces
+    elif tag == 'supplied':
+        yield ['[', None]
+        yield from _content(element, ns, broken=True)
+        yield [']', None]
+    else:
+        yield [''.join(element.itertext()), 'sign']
+
+
+def _content(element, ns, broken=False):
+    'Generate [text, kind] pairs for the content of an element.'
+    if element.text:
+        yield [element.text, 'sign' if _has_signs(element.text) else None]
+    for child in element:
+        yield from _pieces(child, ns, broken)
+        if child.tail:
+            yield [child.tail, 'sign' if _has_signs(child.tail) else None]
+
+
+def _has_signs(text):
+    'Return true if text contains more than separators.'
+    return any(char.isalnum() for char in text)
+
+
+def line_text(line, ns):
+    '''Reconstruct the ATF transliteration of a TEI line element.'''
+    pieces = list(_content(line, ns))
+    # Wrap each run of lower case logograms in underscores.
+    start = None
+    last = None
+    for index, (text, kind) in enumerate(pieces):
+        if kind == 'logogram':
+            if start is None:
+                start = index
+            last = index
+        elif kind == 'sign' and start is not None:
+            pieces[start][0] = '_' + pieces[start][0]
+            pieces[last][0] += '_'
+            start = None
+    if start is not None:
+        pieces[start][0] = '_' + pieces[start][0]
+        pieces[last][0] += '_'
+    return ''.join(text for text, _ in pieces).strip()
+
+
+def add_line(atf, line, ns, interlinear=()):
+    '''Append an edition line, followed by any interlinear
+    translations of it.
+
+    interlinear is a list of (language, lines) pairs, where lines
+    is a deque of the translated l elements not yet written.'''
     label = line.get('n')
-    text = ''.join(line.itertext()).strip()
+    text = line_text(line, ns)
     atf.append(f'{label}. {text}')
+    for language, lines in interlinear:
+        if lines and lines[0].get('n') == label:
+            text = ''.join(lines.popleft().itertext()).strip()
+            atf.append(f'#tr.{language}: {text}')
+
+
+def add_translation(atf, translation, language, ns):
+    'Append a parallel translation section.'
+    # pyoracc only parses parallel translations in English,
+    # which the converter records as 'eng'.
+    if language == 'eng':
+        language = 'en'
+    atf.append(f'@translation parallel {language} project')
+    # Translation sections label surfaces but not objects.
+    for obj in translation.findall('tei:div', ns):
+        for surface in obj.findall('tei:div', ns):
+            atf.append('@' + surface.get('n'))
+            for line in surface.findall('tei:l', ns):
+                atf.append(f'{line.get("n")}. {line_text(line, ns)}')
 
 
 def convert(fp):
@@ -25,6 +121,7 @@ def convert(fp):
         'tei': tei.namespace,
         'xml': 'http://www.w3.org/XML/1998/namespace',
     }
+    lang = f'{{{ns["xml"]}}}lang'
 
     # Collection of lines for output.
     atf = []
@@ -33,9 +130,23 @@ def convert(fp):
     title = xml.find('./tei:teiHeader//tei:title', ns).text
     idno = xml.find('./tei:teiHeader//tei:idno', ns)
     edition = xml.find('./tei:text//tei:div[@type="edition"]', ns)
-    language = edition.get(f'{{{ns["xml"]}}}lang')
+    language = edition.get(lang)
     urn = edition.get('n')
 
+    # Translations with lines directly under them were interlinear,
+    # written after each line they translate. Others are parallel
+    # sections with their own surfaces.
+    interlinear = []
+    parallel = []
+    for translation in xml.findall(
+            './tei:text//tei:div[@type="translation"]', ns):
+        lines = translation.findall('tei:l', ns)
+        if lines:
+            interlinear.append((translation.get(lang),
+                                collections.deque(lines)))
+        else:
+            parallel.append((translation, translation.get(lang)))
+
     # Construct the header.
     if idno is not None:
         # Get the CDLI number from the teiHeader.
@@ -60,12 +171,15 @@ def convert(fp):
         lines = obj.findall('tei:l', ns)
         if lines:
             for line in lines:
-                add_line(atf, line)
+                add_line(atf, line, ns, interlinear)
         # Serialize any subdivisions.
         for surface in obj.findall('tei:div', ns):
             atf.append('@' + surface.get('n'))
             for line in surface.findall('tei:l', ns):
-                add_line(atf, line)
+                add_line(atf, line, ns, interlinear)
+
+    for translation, language in parallel:
+        add_translation(atf, translation, language, ns)
 
     # Return the ATF result as a string.
     return '\n'.join(atf)
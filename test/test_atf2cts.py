@@ -0,0 +1,62 @@
+'''Unit tests for batch conversion to a CTS file repository.'''
+
+import io
+import os
+
+import atf2cts
+import atf2tei
+import pool
+import store
+
+
+test_filename = 'SIL-034.atf'
+
+
+def records(count):
+    'Generate count copies of the test file with distinct codes.'
+    with io.open(test_filename, encoding='utf-8') as f:
+        text = f.read()
+    code = atf2tei.record_code(text)
+    for n in range(count):
+        yield text.replace(code, f'X{n:06d}', 1)
+
+
+def crashing_render(atf):
+    'Render a record, killing the worker for the second one.'
+    if atf.startswith('&X000001'):
+        os._exit(1)
+    return atf2cts.render(atf)
+
+
+def test_convert_all(tmp_path):
+    'Verify records are converted and written to the output store.'
+    output = store.DirectoryStore(str(tmp_path))
+    with pool.Pool(2) as workers:
+        counts, schema_errors = atf2cts.convert_all(
+            records(3), atf2cts.render, workers, output)
+    assert counts['successful'] == 3
+    assert not schema_errors
+    assert sorted(os.listdir(tmp_path)) == [
+        'X000000', 'X000001', 'X000002']
+
+
+def test_worker_crash(tmp_path, capsys):
+    'Verify a record which kills its worker does not stop the batch.'
+    output = store.DirectoryStore(str(tmp_path))
+    with pool.Pool(1) as workers:
+        counts, _ = atf2cts.convert_all(
+            records(3), crashing_render, workers, output)
+    assert counts['successful'] == 2
+    assert counts['parse_failed'] == 1
+    assert sorted(os.listdir(tmp_path)) == ['X000000', 'X000002']
+    assert 'Error converting record X000001' in capsys.readouterr().out
+    assert [stats.reason for stats in workers.stats].count(
+        'exit code 1') == 2
+
+
+def test_convert(tmp_path):
+    'Verify convert writes files and returns three flags.'
+    atf = next(records(1))
+    result = atf2cts.convert(atf, str(tmp_path))
+    assert result == (True, False, False)
+    assert os.listdir(tmp_path) == ['X000000']
@@ -5,6 +5,7 @@ import pytest
 
 import atf2tei
 import atf2cts
+import tei
 
 
 test_filename = 'SIL-034.atf'
@@ -95,3 +96,97 @@ def test_note(text):
     assert len(div.children) == 1
     note = div.children[0]
     assert note.text == text
+
+
+def test_interlinear_normalization():
+    'Verify conversion of a #tr.ts interlinear normalization.'
+    atf = atf_prefix + '1. a-na\n#tr.ts: ana\n'
+    doc = atf2tei.convert(atf)
+    assert len(doc.parts) == 2
+    translation = doc.parts[1]
+    line = translation.children[0]
+    assert line.text == 'ana'
+
+
+def records(count):
+    'Generate count copies of the test file with distinct codes.'
+    with io.open(test_filename, encoding='utf-8') as f:
+        text = f.read()
+    code = atf2tei.record_code(text)
+    for n in range(count):
+        yield text.replace(code, f'X{n:06d}', 1)
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_convert_many(processes):
+    '''Verify batch conversion preserves input order.'''
+    results = list(atf2tei.convert_many(records(5), processes=processes))
+    assert [code for code, _ in results] == \
+        [f'X{n:06d}' for n in range(5)]
+    for code, doc in results:
+        assert doc.header.cdli_code == code
+        assert len(doc.parts) == 1
+
+
+def test_convert_many_unordered():
+    '''Verify unordered batch conversion returns every record.'''
+    results = atf2tei.convert_many(records(6), processes=2,
+                                   ordered=False, window=2)
+    codes = sorted(code for code, _ in results)
+    assert codes == [f'X{n:06d}' for n in range(6)]
+
+
+def test_convert_many_error():
+    '''Verify a failing record is reported without stopping the batch.'''
+    atfs = ['&X000009 = broken\n@tablet\n@@@\n'] + list(records(1))
+    results = list(atf2tei.convert_many(atfs))
+    assert len(results) == 2
+    code, error = results[0]
+    assert code == 'X000009'
+    assert isinstance(error, Exception)
+    assert results[1][0] == 'X000000'
+
+
+def test_parsetab_cache(tmp_path):
+    '''Verify cached parser tables are readable by ply.'''
+    from ply import yacc
+
+    filename = str(tmp_path / 'parsetab.pickle')
+    atf2tei.write_parsetab_cache(filename)
+    table = yacc.LRTable()
+    signature = table.read_pickle(filename)
+    assert signature
+    assert table.lr_action
+    assert table.lr_productions
+
+
+def test_events():
+    '''Verify lazy conversion writes the same XML as the document model.'''
+    atf = atf_prefix + '1. a-na\n#tr.en: to\n$ single ruling\n@reverse\n'
+    doc = atf2tei.convert(atf)
+    out = io.StringIO()
+    tei.EventWriter(out).write(atf2tei.events(atf))
+    assert out.getvalue() == str(doc)
+
+
+def test_tokenize():
+    '''Verify transliterated words are split into typed tokens.'''
+    words = ['{d}utu#', '_a-sza3_', 'LUGAL', '3(disz)', '[...]', 'qi2-bi2#']
+    tokens = atf2tei.tokenize_transliteration(words)
+    kinds = [(token.kind, token.text, token.damaged) for token in tokens
+             if token.kind != 'text']
+    assert kinds == [
+        ('determinative', 'd', False),
+        ('sign', 'utu', True),
+        ('logogram', 'a', False),
+        ('logogram', 'ša3', False),
+        ('logogram', 'LUGAL', False),
+        ('numeral', '3(diš)', False),
+        ('break_open', '[', False),
+        ('gap', '...', False),
+        ('break_close', ']', False),
+        ('sign', 'qi2', False),
+        ('sign', 'bi2', True),
+    ]
+    assert atf2tei.normalize_transliteration(words) == \
+        '{d}⸢utu⸣ a-ša3 LUGAL 3(diš) [...] qi2-⸢bi2⸣'
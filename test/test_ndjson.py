@@ -0,0 +1,77 @@
+'''Unit tests for newline-delimited JSON export.'''
+
+import io
+import json
+
+import pytest
+
+import ndjson
+import tei
+
+
+def sample():
+    'Construct a small document with an edition and a translation.'
+    doc = tei.Document()
+    doc.language = 'akk'
+    doc.header = tei.Header()
+    doc.header.title = 'Example'
+    doc.header.cdli_code = 'X000001'
+    edition = tei.Edition()
+    doc.parts.append(edition)
+    tablet = tei.TextPart('tablet')
+    edition.append(tablet)
+    obverse = tei.TextPart('obverse')
+    tablet.append(obverse)
+    obverse.append(tei.Line('1', [
+        tei.Token('sign', 'a'),
+        tei.Token('text', '-'),
+        tei.Token('sign', 'na', damaged=True),
+        tei.Token('text', ' '),
+        tei.Token('determinative', 'd'),
+        tei.Token('sign', 'utu'),
+    ]))
+    obverse.append(tei.Note('blank space'))
+    obverse.append(tei.Line('2', 'qi2-bi2-ma'))
+    translation = tei.Translation()
+    translation.language = 'eng'
+    translation.append(tei.Line('1', 'To the king'))
+    doc.parts.append(translation)
+    return doc
+
+
+def test_lines():
+    'Verify one record is written per line.'
+    out = io.StringIO()
+    ndjson.write(sample(), out)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(records) == 3
+    assert records[0] == {
+        'code': 'X000001',
+        'part': 'edition',
+        'language': 'akk',
+        'object': 'tablet',
+        'surface': 'obverse',
+        'label': '1',
+        'text': 'a-⸢na⸣ {d}utu',
+    }
+    assert records[2]['part'] == 'translation'
+    assert records[2]['language'] == 'eng'
+    assert records[2]['object'] is None
+
+
+def test_document():
+    'Verify a single record is written per document.'
+    out = io.StringIO()
+    ndjson.write(sample(), out, per='document')
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record['code'] == 'X000001'
+    assert record['title'] == 'Example'
+    assert [line['label'] for line in record['lines']] == ['1', '2', '1']
+
+
+def test_unknown():
+    'Verify an unknown record type is rejected.'
+    with pytest.raises(ValueError):
+        ndjson.write(sample(), io.StringIO(), per='word')
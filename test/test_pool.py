@@ -0,0 +1,94 @@
+'''Unit tests for the recycling process pool.'''
+
+import functools
+import os
+
+import pytest
+
+import pool
+
+
+def square(x):
+    return x * x
+
+
+def fail(x):
+    raise ValueError(x)
+
+
+def crash_once(marker, x):
+    'Kill the worker the first time it is called.'
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return x
+
+
+def test_results():
+    'Verify every item is processed.'
+    with pool.Pool(2) as workers:
+        results = workers.imap_unordered(square, range(20))
+        assert sorted(results) == [x * x for x in range(20)]
+    assert [stats.reason for stats in workers.stats] == ['done', 'done']
+    assert sum(stats.tasks for stats in workers.stats) == 20
+    assert all(stats.peak_rss > 0 for stats in workers.stats)
+
+
+def test_max_tasks():
+    'Verify workers are replaced after a number of tasks.'
+    with pool.Pool(2, max_tasks=3) as workers:
+        assert len(list(workers.imap_unordered(square, range(10)))) == 10
+    assert sum(stats.tasks for stats in workers.stats) == 10
+    assert all(stats.tasks <= 3 for stats in workers.stats)
+    assert len(workers.stats) >= 4
+
+
+@pytest.mark.skipif(pool.rss() is None, reason='needs /proc')
+def test_max_rss():
+    'Verify workers over the memory ceiling are replaced.'
+    with pool.Pool(1, max_rss=1) as workers:
+        assert len(list(workers.imap_unordered(square, range(3)))) == 3
+    assert [stats.reason for stats in workers.stats] == ['max rss'] * 3
+
+
+def test_exception():
+    'Verify task exceptions reach the caller.'
+    with pytest.raises(ValueError):
+        with pool.Pool(1) as workers:
+            list(workers.imap_unordered(fail, [1]))
+
+
+def test_crash(tmp_path):
+    'Verify a task is rerun when its worker dies.'
+    func = functools.partial(crash_once, str(tmp_path / 'marker'))
+    with pool.Pool(1) as workers:
+        assert list(workers.imap_unordered(func, [7])) == [7]
+    assert workers.stats[0].reason == 'exit code 1'
+
+
+def test_repeated_crash(tmp_path):
+    'Verify a task which always kills its worker is reported.'
+    with pytest.raises(pool.WorkerError) as error:
+        with pool.Pool(1) as workers:
+            list(workers.imap_unordered(os._exit, [1]))
+    assert error.value.item == 1
+
+
+def test_reuse_after_error():
+    'Verify the pool can be used again after a task fails.'
+    with pool.Pool(2) as workers:
+        with pytest.raises(ValueError):
+            list(workers.imap_unordered(fail, range(4)))
+        assert sorted(workers.imap_unordered(square, range(4))) == \
+            [0, 1, 4, 9]
+
+
+def test_return_errors():
+    'Verify failed items can be generated as results.'
+    with pool.Pool(1) as workers:
+        results = list(workers.imap_unordered(os._exit, [1, 2],
+                                              return_errors=True))
+        assert [type(result) for result in results] == \
+            [pool.WorkerError, pool.WorkerError]
+        assert sorted(result.item for result in results) == [1, 2]
+        assert list(workers.imap_unordered(square, [3])) == [9]
@@ -0,0 +1,58 @@
+'''Unit tests for merging profiles across worker processes.'''
+
+import profiling
+
+
+def work(count):
+    return sum(range(count))
+
+
+def test_run():
+    'Verify run returns the result along with raw stats.'
+    result, stats = profiling.run(work, 10)
+    assert result == 45
+    assert any(name == 'work' for _, _, name in stats)
+
+
+def test_aggregate(tmp_path):
+    'Verify stats from several calls are merged.'
+    profile = profiling.Aggregate()
+    for _ in range(3):
+        _, stats = profiling.run(work, 1000)
+        profile.add(stats)
+    assert profile.calls == 3
+    calls = [nc for (_, _, name), (_, nc, _, _, _)
+             in profile.stats.stats.items() if name == 'work']
+    assert calls == [3]
+
+    filename = tmp_path / 'out.collapsed'
+    profile.write_collapsed(str(filename))
+    for line in filename.read_text().splitlines():
+        stack, weight = line.rsplit(' ', 1)
+        assert stack
+        assert int(weight) > 0
+
+
+def test_single_walk(tmp_path, monkeypatch, capsys):
+    'Verify the call graph is walked once for both outputs.'
+    profile = profiling.Aggregate()
+    _, stats = profiling.run(work, 1000)
+    profile.add(stats)
+    walks = []
+    stacks = profile.stacks
+    monkeypatch.setattr(profile, 'stacks',
+                        lambda: walks.append(1) or stacks())
+    profile.write_collapsed(str(tmp_path / 'out.collapsed'))
+    profile.report()
+    assert len(walks) == 1
+    assert 'Profiled 1 conversions' in capsys.readouterr().out
+
+
+def test_category():
+    'Verify functions are attributed to converter stages.'
+    assert profiling.category(
+        ('/lib/pyoracc/atf/common/atffile.py', 48, '__init__')) == 'pyoracc'
+    assert profiling.category(
+        ('atf2tei.py', 133, 'tokenize_transliteration')) == 'normalization'
+    assert profiling.category(('tei.py', 20, '__str__')) == 'serialization'
+    assert profiling.category(('~', 0, '<built-in method len>')) is None
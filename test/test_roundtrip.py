@@ -0,0 +1,110 @@
+'''Unit tests for the round-trip harness.'''
+
+import io
+
+import pytest
+
+import roundtrip
+import tei2atf
+
+
+test_filename = 'SIL-034.atf'
+
+
+def test_check():
+    'Verify the sample record round-trips without mismatches.'
+    with io.open(test_filename, encoding='utf-8') as f:
+        code, mismatches = roundtrip.check(f.read())
+    assert code == 'P481090'
+    assert mismatches == []
+
+
+@pytest.mark.parametrize('line', ['{d}UTU', 'LUGAL#', '[LUGAL]', '[{d}UTU]'])
+def test_element_only_line(line):
+    'Verify lines made only of marked-up signs round-trip.'
+    atf = f'&X001001 = Test\n#atf: lang akk\n@tablet\n@obverse\n1. {line}\n'
+    assert roundtrip.check(atf) == ('X001001', [])
+
+
+def test_break_spanning_lines():
+    'Verify breaks continuing over several lines are not reported.'
+    atf = '''&X001001 = Test
+#atf: lang akk
+@tablet
+@obverse
+1. a-na [x
+2. a-na x]
+3. x] a [b
+'''
+    assert roundtrip.check(atf) == ('X001001', [])
+    assert roundtrip.normalize('a-na  x]') == '[a-na x]'
+    assert roundtrip.normalize('x] a [b') == '[x] a [b]'
+
+
+def test_parse_error():
+    'Verify unparseable records are reported.'
+    code, mismatches = roundtrip.check('&X000001 = Broken\n@@@\n')
+    assert code == 'X000001'
+    assert [mismatch[0] for mismatch in mismatches] == ['parse']
+
+
+def test_text_mismatch(monkeypatch):
+    'Verify changed line text is reported with its location.'
+    monkeypatch.setattr(tei2atf, 'line_text', lambda line, ns: 'x')
+    with io.open(test_filename, encoding='utf-8') as f:
+        _, mismatches = roundtrip.check(f.read())
+    category, location, expected, actual = mismatches[0]
+    assert category == 'text'
+    assert location == ('edition', 'tablet', 'obverse', '1')
+    assert expected == 'a-na be-el-šu-nu'
+    assert actual == 'x'
+
+
+def test_translations():
+    'Verify interlinear and parallel translations are compared.'
+    atf = '''&X001001 = Test
+#atf: lang akk
+@tablet
+@obverse
+1. a-na
+#tr.en: to
+@reverse
+1. qi2-bi2-ma
+#tr.en: speak
+
+@translation parallel en project
+@obverse
+1. to
+'''
+    assert roundtrip.check(atf) == ('X001001', [])
+
+
+def test_dropped_translation(monkeypatch):
+    'Verify a lost translation is reported as a missing part.'
+    monkeypatch.setattr(tei2atf, 'add_translation', lambda *args: None)
+    atf = '''&X001001 = Test
+#atf: lang akk
+@tablet
+@obverse
+1. a-na
+
+@translation parallel en project
+@obverse
+1. to
+'''
+    _, mismatches = roundtrip.check(atf)
+    assert mismatches == [('part', 'translation eng', '1 lines', None)]
+
+
+def test_summary(capsys):
+    'Verify mismatches are tallied by category.'
+    summary = roundtrip.Summary()
+    summary.add('P000001', [])
+    summary.add('P000002',
+                [('missing', ('edition', 'tablet', None, '3'), 'a', None),
+                 ('missing', ('edition', 'tablet', None, '4'), 'b', None)])
+    assert summary.records == 2
+    assert summary.failed == 1
+    assert summary.counts['missing'] == 2
+    summary.report(1.0)
+    assert 'P000002 edition tablet 3' in capsys.readouterr().out
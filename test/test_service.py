@@ -0,0 +1,115 @@
+'''Unit tests for the conversion service.'''
+
+import asyncio
+import io
+import json
+from concurrent import futures
+
+import service
+
+
+test_filename = 'SIL-034.atf'
+
+
+def read_atf():
+    with io.open(test_filename, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_lru_cache():
+    'Verify the cache evicts least recently used entries by size.'
+    cache = service.LRUCache(10)
+    cache.put('a', b'xxxx')
+    cache.put('b', b'xxxx')
+    assert cache.get('a') == b'xxxx'
+    cache.put('c', b'xxxx')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'xxxx'
+    assert cache.used == 8
+    cache.put('d', b'x' * 11)
+    assert cache.get('d') is None
+    assert len(cache) == 2
+
+
+def test_convert_cache():
+    'Verify identical requests are coalesced and then cached.'
+    atf = read_atf()
+
+    async def run():
+        with futures.ThreadPoolExecutor(2) as exe:
+            svc = service.Service(exe)
+            first = await asyncio.gather(
+                *[svc.convert('/tei', atf) for _ in range(3)])
+            second = await svc.convert('/tei', atf)
+            return svc, first, second
+
+    svc, first, second = asyncio.run(run())
+    assert first[0].startswith(b'<?xml')
+    assert first.count(first[0]) == 3
+    assert second == first[0]
+    assert svc.metrics.misses == 1
+    assert svc.metrics.coalesced == 2
+    assert svc.metrics.hits == 1
+    assert not svc.inflight
+
+
+def test_http():
+    'Verify conversion and metrics over HTTP.'
+    atf = read_atf().encode('utf-8')
+
+    async def request(port, method, path, body=b''):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'{method} {path} HTTP/1.1\r\n'
+                     f'Content-Length: {len(body)}\r\n'
+                     'Connection: close\r\n\r\n'.encode('ascii') + body)
+        response = await reader.read()
+        writer.close()
+        head, _, content = response.partition(b'\r\n\r\n')
+        return head.split(b' ', 2)[1], content.decode('utf-8')
+
+    async def run():
+        svc = service.Service()
+        server = await asyncio.start_server(svc.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            cts = await request(port, 'POST', '/cts', atf)
+            bad = await request(port, 'POST', '/tei', b'not atf')
+            missing = await request(port, 'GET', '/nowhere')
+            metrics = await request(port, 'GET', '/metrics')
+        return cts, bad, missing, metrics
+
+    cts, bad, missing, metrics = asyncio.run(run())
+    status, content = cts
+    assert status == b'200'
+    files = json.loads(content)
+    assert 'P481090/P481090/__cts__.xml' in files
+    assert bad[0] == b'422'
+    assert missing[0] == b'404'
+    status, content = metrics
+    assert status == b'200'
+    metrics = json.loads(content)
+    assert metrics['requests'] == 2
+    assert metrics['errors'] == 1
+    assert metrics['latency']['count'] == 2
+
+
+def test_request_limits():
+    'Verify oversized and invalid request bodies are refused.'
+
+    async def request(port, length):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write('POST /tei HTTP/1.1\r\n'
+                     f'Content-Length: {length}\r\n\r\n'.encode('ascii'))
+        response = await reader.read()
+        writer.close()
+        return response.split(b' ', 2)[1]
+
+    async def run():
+        svc = service.Service(max_body=100)
+        server = await asyncio.start_server(svc.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return [await request(port, length)
+                    for length in ('101', str(2**40), '-5', 'abc')]
+
+    assert asyncio.run(run()) == [b'413', b'413', b'400', b'400']
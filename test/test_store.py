@@ -0,0 +1,87 @@
+'''Unit tests for the CTS output stores.'''
+
+import io
+import multiprocessing
+import os
+
+import atf2cts
+import atf2tei
+import store
+
+
+test_filename = 'SIL-034.atf'
+
+
+def converted_files():
+    'Return the CTS files for the test record.'
+    with io.open(test_filename, encoding='utf-8') as f:
+        doc = atf2tei.convert(f.read())
+    return atf2cts.export(doc)
+
+
+def test_sqlite(tmp_path):
+    'Verify files round-trip through the database by URN.'
+    files = converted_files()
+    db = store.SQLiteStore(str(tmp_path / 'corpus.db'), batch_size=2)
+    for path, urn, xml in files:
+        db.write(path, urn, xml)
+    for path, urn, xml in files:
+        assert db.read(urn) == xml
+    assert db.read('urn:cts:cdli:missing') is None
+    assert len(list(db.files())) == len(files)
+    db.close()
+
+
+def test_replace(tmp_path):
+    'Verify writing a URN again replaces its earlier version.'
+    with store.SQLiteStore(str(tmp_path / 'corpus.db')) as db:
+        db.write('a/b.xml', 'urn:test', '<old/>')
+        db.write('a/b.xml', 'urn:test', '<new/>')
+        assert db.read('urn:test') == '<new/>'
+        assert len(list(db.files())) == 1
+
+
+def test_export(tmp_path):
+    'Verify an exported database matches a directly written repository.'
+    files = converted_files()
+    direct = store.DirectoryStore(str(tmp_path / 'direct'))
+    with store.SQLiteStore(str(tmp_path / 'corpus.db')) as db:
+        for path, urn, xml in files:
+            direct.write(path, urn, xml)
+            db.write(path, urn, xml)
+    with store.SQLiteStore(str(tmp_path / 'corpus.db')) as db:
+        assert db.export(str(tmp_path / 'exported')) == len(files)
+    for path, _, xml in files:
+        with io.open(tmp_path / 'exported' / path, encoding='utf-8') as f:
+            assert f.read() == xml
+        assert os.path.exists(tmp_path / 'direct' / path)
+
+
+def test_directory_replace(tmp_path):
+    'Verify files are replaced without leaving temporary files.'
+    directory = store.DirectoryStore(str(tmp_path))
+    directory.write('a/b.xml', 'urn:test', '<old/>')
+    directory.write('a/b.xml', 'urn:test', '<new/>')
+    assert os.listdir(tmp_path / 'a') == ['b.xml']
+    assert (tmp_path / 'a' / 'b.xml').read_text() == '<new/>'
+
+
+def write_many(data_path, xml):
+    'Write the same file repeatedly.'
+    directory = store.DirectoryStore(data_path)
+    for _ in range(200):
+        directory.write('a/b.xml', 'urn:test', xml)
+
+
+def test_concurrent_writers(tmp_path):
+    'Verify processes writing the same path do not collide.'
+    writers = [multiprocessing.Process(target=write_many,
+                                       args=(str(tmp_path), f'<w{n}/>'))
+               for n in range(2)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert [writer.exitcode for writer in writers] == [0, 0]
+    assert os.listdir(tmp_path / 'a') == ['b.xml']
+    assert (tmp_path / 'a' / 'b.xml').read_text() in ('<w0/>', '<w1/>')
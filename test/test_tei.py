@@ -1,7 +1,11 @@
 '''Unit tests for generating Canonical Text Services index files.'''
 
+import io
 import xml.etree.ElementTree as ET
 
+import pytest
+
+import atf2tei
 import tei
 
 
@@ -75,3 +79,95 @@ def test_document():
     divs = xml.findall(qualify('text/body/div'))
     assert divs[0].attrib['type'] == 'edition'
     assert divs[1].attrib['type'] == 'translation'
+
+
+def test_event_writer():
+    'Verify incremental serialization of events.'
+    doc = tei.Document()
+    edition = tei.Edition()
+    part = tei.TextPart('obverse')
+    empty = tei.TextPart('reverse')
+    events = [
+        ('start', doc),
+        ('start', edition),
+        ('start', part),
+        ('child', tei.Line('1', 'a-na')),
+        ('end', part),
+        ('start', empty),
+        ('end', empty),
+        ('end', edition),
+        ('end', doc),
+    ]
+    out = io.StringIO()
+    tei.EventWriter(out).write(events)
+    doc.parts.append(edition)
+    edition.append(part)
+    part.append(tei.Line('1', 'a-na'))
+    edition.append(empty)
+    assert out.getvalue() == str(doc)
+
+
+def test_tokens():
+    'Verify serialization of line tokens as elements.'
+    tokens = [
+        tei.Token('break_open', '['),
+        tei.Token('determinative', 'd'),
+        tei.Token('sign', 'utu'),
+        tei.Token('break_close', ']'),
+        tei.Token('text', ' '),
+        tei.Token('logogram', 'LUGAL', damaged=True),
+        tei.Token('text', ' '),
+        tei.Token('numeral', '3(diš)'),
+    ]
+    line = tei.Line('1', tokens)
+    assert line.text == '[{d}utu] ⸢LUGAL⸣ 3(diš)'
+    xml = ET.fromstring(str(line))
+    supplied = xml.find('supplied')
+    assert supplied.get('reason') == 'lost'
+    assert supplied.find('c').get('type') == 'determinative'
+    assert supplied.find('c').tail == 'utu'
+    logo = xml.find('damage/c')
+    assert logo.get('subtype') == 'logo'
+    assert logo.text == 'LUGAL'
+    assert xml.find('num').text == '3(diš)'
+    assert ''.join(xml.itertext()) == 'dutu LUGAL 3(diš)'
+
+
+def line_xml(atf):
+    'Tokenize a transliteration and return the XML of its line.'
+    line = tei.Line('1', atf2tei.tokenize_transliteration(atf.split()))
+    return ET.tostring(line.xml, encoding='unicode')
+
+
+def test_lost_gap():
+    'Verify a bracketed gap is not marked as supplied text.'
+    xml = line_xml('[...] a-na')
+    assert xml.startswith('<l n="1"><gap reason="lost"')
+    assert 'supplied' not in xml
+    assert 'reason="illegible"' in line_xml('a-na ... x')
+
+
+def test_break_spanning_lines():
+    'Verify breaks opened or closed on another line are supplied.'
+    assert line_xml('a-na x]') == \
+        '<l n="1"><supplied reason="lost">a-na x</supplied></l>'
+    assert line_xml('[x a-na') == \
+        '<l n="1"><supplied reason="lost">x a-na</supplied></l>'
+    assert line_xml('x] a [b') == \
+        '<l n="1"><supplied reason="lost">x</supplied> a ' \
+        '<supplied reason="lost">b</supplied></l>'
+
+
+@pytest.mark.parametrize('atf', ['{d}UTU', 'LUGAL#', '[LUGAL]', '[{d}UTU]'])
+def test_element_only_line(atf):
+    'Verify no whitespace is added inside lines made only of elements.'
+    line = str(tei.Line('1', atf2tei.tokenize_transliteration([atf])))
+    line = line[line.index('<l '):]
+    assert '\n' not in line.strip()
+
+    record = f'&X001001 = Test\n#atf: lang akk\n@tablet\n@obverse\n1. {atf}\n'
+    doc = str(atf2tei.convert(record))
+    assert line.strip() in doc
+    f = io.StringIO()
+    tei.EventWriter(f).write(atf2tei.events(record))
+    assert f.getvalue() == doc
@@ -30,3 +30,35 @@ def test_iliad():
         assert 'lang grc' in atf
         assert '@Book 1' in atf
         assert '1. μῆνιν ἄειδε θεὰ' in atf
+
+
+def test_markup():
+    '''Verify sign markup is converted back to ATF.'''
+    atf = '''&X001001 = Test
+#atf: lang akk
+@tablet
+@obverse
+1. [a-na] {d}utu# _dumu-mesz_-ia LUGAL [...] 3(disz)
+'''
+    xml = atf2tei.convert(atf)
+    result = tei2atf.convert(io.StringIO(str(xml)))
+    assert '1. [a-na] {d}utu# _dumu-meš_-ia LUGAL [...] 3(diš)' in result
+
+
+def test_translations():
+    '''Verify translations are converted back to ATF.'''
+    atf = '''&X001001 = Test
+#atf: lang akk
+@tablet
+@obverse
+1. a-na
+#tr.en: to
+
+@translation parallel en project
+@obverse
+1. to
+'''
+    xml = atf2tei.convert(atf)
+    result = tei2atf.convert(io.StringIO(str(xml)))
+    assert '1. a-na\n#tr.en: to\n' in result
+    assert result.endswith('@translation parallel en project\n@obverse\n1. to')
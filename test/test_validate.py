@@ -0,0 +1,49 @@
+'''Unit tests for Epidoc schema validation.'''
+
+import io
+
+import pytest
+
+import atf2cts
+import atf2tei
+import tei
+
+pytest.importorskip('lxml')
+
+import validate  # noqa: E402
+
+
+test_filename = 'SIL-034.atf'
+
+
+def test_valid():
+    'Verify converted TEI parts are valid Epidoc.'
+    with io.open(test_filename, encoding='utf-8') as f:
+        doc = atf2tei.convert(f.read())
+    for path, _, xml in atf2cts.export(doc):
+        if not path.endswith('__cts__.xml'):
+            assert validate.validate(xml) == []
+
+
+def test_invalid():
+    'Verify schema errors are reported.'
+    doc = tei.Document()
+    errors = validate.validate(str(doc))
+    assert errors
+    line, message = errors[0]
+    assert line > 1
+    assert message
+
+
+def test_malformed():
+    'Verify malformed XML is reported rather than raised.'
+    errors = validate.validate('<TEI>')
+    assert len(errors) == 1
+
+
+def test_convert(tmp_path):
+    'Verify validation results are returned from a conversion.'
+    with io.open(test_filename, encoding='utf-8') as f:
+        atf = f.read()
+    result = atf2cts.convert(atf, str(tmp_path), validate=True)
+    assert result == (True, False, False, [])
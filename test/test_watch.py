@@ -0,0 +1,139 @@
+'''Unit tests for watching ATF sources for changes.'''
+
+import os
+
+import pytest
+
+import atf2cts
+import pool
+import watch
+
+
+first = '''&X000001 = First
+@tablet
+@obverse
+1. a-na
+'''
+
+second = '''&X000002 = Second
+@tablet
+@obverse
+1. qi2-bi2-ma
+'''
+
+
+def write(path, text):
+    'Write a file and move its modification time forward.'
+    path.write_text(text, encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def codes(records):
+    return sorted(atf.split()[0] for atf in records)
+
+
+def poll(watcher):
+    'Poll for changes and mark every changed record as written.'
+    changed, removed = watcher.poll()
+    for atf in changed:
+        watcher.done(atf.split()[0][1:], watch.digest(atf))
+    return changed, removed
+
+
+def test_poll(tmp_path):
+    'Verify only new and edited records are returned.'
+    source = tmp_path / 'corpus.atf'
+    write(source, first + second)
+    watcher = watch.Watcher([str(source)])
+    changed, removed = poll(watcher)
+    assert codes(changed) == ['&X000001', '&X000002']
+    assert removed == []
+
+    assert poll(watcher) == ([], [])
+
+    write(source, first + second.replace('qi2', 'qi'))
+    changed, removed = poll(watcher)
+    assert codes(changed) == ['&X000002']
+
+    # Rewriting identical content changes nothing.
+    write(source, first + second.replace('qi2', 'qi'))
+    assert poll(watcher) == ([], [])
+
+
+def test_removed(tmp_path):
+    'Verify deleted records are reported, and moved ones are not.'
+    (tmp_path / 'nested').mkdir()
+    one = tmp_path / 'one.atf'
+    two = tmp_path / 'nested' / 'two.atf'
+    write(one, first + second)
+    write(two, '')
+    (tmp_path / 'notes.txt').write_text('not atf')
+    watcher = watch.Watcher([str(tmp_path)])
+    assert len(poll(watcher)[0]) == 2
+
+    # Move the second record to another file.
+    write(one, first)
+    write(two, second)
+    assert poll(watcher) == ([], [])
+
+    os.remove(two)
+    assert poll(watcher) == ([], ['X000002'])
+
+
+def test_outstanding(tmp_path):
+    'Verify records are returned until their output is written.'
+    source = tmp_path / 'corpus.atf'
+    write(source, first + second)
+    watcher = watch.Watcher([str(source)])
+    assert len(watcher.poll()[0]) == 2
+    watcher.done('X000001', watch.digest(first))
+    assert watcher.poll() == ([second], [])
+
+    # A record edited during conversion stays outstanding.
+    edited = second.replace('qi2', 'qi')
+    write(source, first + edited)
+    assert watcher.poll() == ([edited], [])
+    watcher.done('X000002', watch.digest(second))
+    assert watcher.poll() == ([edited], [])
+
+
+def crashing_render(atf):
+    'Render a record, killing the worker for the second one.'
+    if atf.startswith('&X000002'):
+        os._exit(1)
+    return atf2cts.render(atf)
+
+
+class Output:
+    'Output store collecting written paths.'
+
+    def __init__(self):
+        self.paths = []
+
+    def write(self, path, urn, xml):
+        self.paths.append(path)
+
+    def flush(self):
+        pass
+
+
+def test_run_worker_error(tmp_path, monkeypatch, capsys):
+    'Verify a record which kills its worker does not stop watching.'
+    source = tmp_path / 'corpus.atf'
+    write(source, first + second)
+    polls = []
+
+    def sleep(seconds):
+        polls.append(seconds)
+        if len(polls) == 2:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(watch.time, 'sleep', sleep)
+    output = Output()
+    with pool.Pool(1) as workers:
+        with pytest.raises(KeyboardInterrupt):
+            watch.run([str(source)], crashing_render, output, workers)
+    assert 'Skipping record X000002' in capsys.readouterr().out
+    assert any(path.startswith('X000001') for path in output.paths)
+    assert not any(path.startswith('X000002') for path in output.paths)
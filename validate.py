@@ -0,0 +1,39 @@
+'''Validation of converted documents against the Epidoc schema.
+
+Requires lxml. The RelaxNG schema is bundled under schema/ and
+compiled once per process, the first time it is needed.'''
+
+import os
+
+
+schema_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'schema', 'tei-epidoc.rng')
+
+# Compiled schema shared by every validation in this process.
+_schema = None
+
+
+def schema():
+    'Return the compiled Epidoc RelaxNG schema.'
+    global _schema
+    if _schema is None:
+        from lxml import etree
+        _schema = etree.RelaxNG(etree.parse(schema_path))
+    return _schema
+
+
+def validate(xml):
+    '''Validate a serialized TEI document against the Epidoc schema.
+
+    Returns a list of (line, message) tuples describing each error,
+    which is empty if the document is valid.'''
+    from lxml import etree
+
+    rng = schema()
+    try:
+        tree = etree.fromstring(xml.encode('utf-8'))
+    except etree.XMLSyntaxError as e:
+        return [(e.lineno, e.msg)]
+    if rng.validate(tree):
+        return []
+    return [(error.line, error.message) for error in rng.error_log]
@@ -0,0 +1,162 @@
+'''Watch ATF sources and reconvert records as they change.
+
+Input files are polled for changes to their modification time
+and size. Changed files are segmented again, and only records
+whose content hash differs from the version last converted are
+sent to the workers, so publishing an edit takes seconds rather
+than a full rebuild.'''
+
+import hashlib
+import io
+import os
+import time
+
+import atf2tei
+
+
+def atf_files(paths):
+    'Generate ATF filenames from files and directories to watch.'
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.atf'):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def digest(atf):
+    'Return a hash of the content of an ATF record.'
+    return hashlib.sha256(atf.encode('utf-8')).hexdigest()
+
+
+class Watcher:
+    '''Tracks ATF records across polls of a set of input paths.
+
+    Records returned by poll are outstanding until passed to done,
+    and are returned again by every poll until then.'''
+
+    def __init__(self, paths):
+        self.paths = paths
+        # Modification time and size of each file at the last poll.
+        self.stamps = {}
+        # Record codes found in each file.
+        self.codes = {}
+        # Hash of the last version of each record written out.
+        self.digests = {}
+        # (hash, atf) of records which still need converting.
+        self.outstanding = {}
+
+    def poll(self):
+        '''Check the inputs for changed records.
+
+        Returns a (changed, removed) tuple, where changed is a list
+        of ATF records which are new or differ from the version last
+        written out, and removed lists the codes of records no longer
+        present in any file. The first poll returns every record.'''
+        from atf2cts import segmentor
+
+        stamps = {}
+        for filename in atf_files(self.paths):
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            stamps[filename] = stat.st_mtime_ns, stat.st_size
+
+        removed = set()
+        for filename in self.stamps.keys() - stamps.keys():
+            removed.update(self.codes.pop(filename, ()))
+        for filename, stamp in stamps.items():
+            if self.stamps.get(filename) == stamp:
+                continue
+            try:
+                with io.open(filename, encoding='utf-8') as f:
+                    records = list(segmentor(f, verbose=False))
+            except (OSError, UnicodeDecodeError) as e:
+                # Possibly caught mid-write; try again next poll.
+                print('Could not read', filename, e)
+                stamps[filename] = self.stamps.get(filename)
+                continue
+            codes = set()
+            for atf in records:
+                code = atf2tei.record_code(atf)
+                codes.add(code)
+                content = digest(atf)
+                if self.digests.get(code) != content:
+                    self.outstanding[code] = content, atf
+                else:
+                    # Changed back to the version already written.
+                    self.outstanding.pop(code, None)
+            removed.update(self.codes.get(filename, set()) - codes)
+            self.codes[filename] = codes
+        self.stamps = stamps
+
+        # Records which moved to another file are still present.
+        for codes in self.codes.values():
+            removed -= codes
+        for code in removed:
+            self.digests.pop(code, None)
+            self.outstanding.pop(code, None)
+        changed = [atf for _, atf in self.outstanding.values()]
+        return changed, sorted(removed)
+
+    def done(self, code, content):
+        '''Record that a version of a record has been handled.
+
+        content is the digest of the version, so a record edited
+        while it was being converted remains outstanding.'''
+        self.digests[code] = content
+        if self.outstanding.get(code, (None,))[0] == content:
+            del self.outstanding[code]
+
+
+def _convert(task, atf):
+    'Run task on a record, returning its code and digest with the result.'
+    return atf2tei.record_code(atf), digest(atf), task(atf)
+
+
+def run(paths, task, output, workers, interval=1.0):
+    '''Convert records from paths, then keep them up to date.
+
+    task is called on each changed record in the worker pool and
+    must return a tuple like atf2cts.render, whose files are
+    written to output. A record is converted again on the next
+    poll unless its files were written. Records which fail to
+    convert, or which repeatedly kill their worker, are skipped
+    until they change. Runs until interrupted.'''
+    import functools
+
+    import pool
+
+    watcher = Watcher(paths)
+    convert = functools.partial(_convert, task)
+    print('Watching', ', '.join(paths))
+    while True:
+        start = time.perf_counter()
+        changed, removed = watcher.poll()
+        for code in removed:
+            print(f'Record {code} was removed; its files are unchanged.')
+        if changed:
+            successful = 0
+            written = []
+            try:
+                for code, content, result in workers.imap_unordered(
+                        convert, changed):
+                    successful += result[0]
+                    for path, urn, xml in result[4]:
+                        output.write(path, urn, xml)
+                    written.append((code, content))
+            except pool.WorkerError as e:
+                code = atf2tei.record_code(e.item)
+                print(f'Skipping record {code} until it changes:', e)
+                watcher.done(code, digest(e.item))
+            output.flush()
+            for code, content in written:
+                watcher.done(code, content)
+            seconds = time.perf_counter() - start
+            print(f'Converted {successful} of {len(changed)} changed',
+                  f'records in {seconds:0.3f} seconds.')
+        time.sleep(interval)